@@ -0,0 +1,458 @@
+"""Closed-loop load test for pdfApp and textEditorApp under Gunicorn.
+
+Starts the chosen app locally under the production server (or targets one
+that is already running), then has ``--users`` virtual users replay a
+weighted traffic mix with realistic payloads: keystroke-sized
+``/api/count-text`` calls next to whole-document analyses for the text
+editor; multi-file merges, scans, splits and text extraction for the PDF
+tools. Payloads are generated up front, so client-side work does not
+skew the timings.
+
+Reports throughput, p50/p95/p99 latency and error rate per scenario, plus
+a timeline of requests/s, p95 and server RSS (Gunicorn master, workers and
+their process pools; Linux only). ``--output`` writes the results as JSON;
+``--compare`` checks a run against an earlier one and exits non-zero when
+throughput, tail latency or error rate got worse than ``--tolerance``.
+
+    python loadtest/load_test.py text --users 50 --duration 60 --output before.json
+    python loadtest/load_test.py pdf --workers 4 --mix merge=3,extract-text=1
+    python loadtest/load_test.py text --url http://127.0.0.1:5000 --pid 1234
+    python loadtest/load_test.py text --compare before.json --output after.json
+    python loadtest/load_test.py pdf --asgi        # Gunicorn with uvicorn workers
+
+Auth and rate limiting are switched off in the spawned server; a server
+given with ``--url`` must be configured the same way.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "textEditorApp", "benchmarks"))
+
+import corpus  # noqa: E402
+
+
+# ---- payloads ----
+
+def _json_request(path, data):
+    return "POST", path, json.dumps(data).encode(), {"Content-Type": "application/json"}
+
+
+def _multipart_request(path, fields=(), files=()):
+    """``fields``: (name, value); ``files``: (name, filename, content_type, bytes)."""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content_type, data in files:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n'.encode())
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return "POST", path, body.getvalue(), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+class TextPayloads:
+    def __init__(self):
+        # One long document; requests take prefixes of it, like an editor
+        # whose content grows as the user types
+        self.document = corpus.generate("prose", 256 * 1024, seed=1)
+        self.batch_documents = [corpus.generate("prose", 2048, seed=i) for i in range(50)]
+
+    def text(self, rng, low, high):
+        return self.document[:rng.randint(low, high)]
+
+
+def _text_scenarios(payloads):
+    return {
+        "page": (5, lambda rng: ("GET", "/", None, {})),
+        "count-text": (60, lambda rng: _json_request(
+            "/api/count-text", {"text": payloads.text(rng, 200, 20_000)})),
+        "convert-case": (10, lambda rng: _json_request(
+            "/api/convert-case", {"text": payloads.text(rng, 2_000, 20_000), "case_type": "title"})),
+        "find-replace": (8, lambda rng: _json_request(
+            "/api/find-replace", {"text": payloads.text(rng, 10_000, 64_000), "find": r"\bthe\b",
+                                  "replace": "THE", "use_regex": True})),
+        "clean-text": (7, lambda rng: _json_request(
+            "/api/clean-text", {"text": payloads.text(rng, 10_000, 64_000), "clean_type": "all"})),
+        "seo-analysis": (8, lambda rng: _json_request(
+            "/api/seo-analysis", {"text": payloads.text(rng, 16_000, 128_000), "keyword": "product quality"})),
+        "batch": (2, lambda rng: _json_request(
+            "/api/batch", {"operation": "count-text", "documents": payloads.batch_documents})),
+    }
+
+
+class PdfPayloads:
+    def __init__(self):
+        import fitz
+        from PIL import Image, ImageDraw
+
+        def pdf(pages, seed):
+            doc = fitz.open()
+            for i in range(pages):
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(50, 50, 545, 790), corpus.generate("prose", 2500, seed=seed + i))
+            data = doc.tobytes(garbage=3, deflate=True)
+            doc.close()
+            return data
+
+        def photo(width, height, seed):
+            rng = random.Random(seed)
+            img = Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(200):
+                x, y = rng.randrange(width), rng.randrange(height)
+                draw.ellipse((x, y, x + rng.randint(20, 400), y + rng.randint(20, 400)),
+                             fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=85)
+            return out.getvalue()
+
+        self.small_pdfs = [pdf(pages, seed) for seed, pages in enumerate((2, 5, 10, 20))]
+        self.long_pdf = pdf(60, 100)
+        self.photos = [photo(2400, 1800, seed) for seed in range(3)]
+
+
+def _pdf_scenarios(payloads):
+    def merge(rng):
+        picks = [rng.choice(payloads.small_pdfs) for _ in range(rng.randint(2, 4))]
+        return _multipart_request("/merge", files=[("files", f"part{i}.pdf", "application/pdf", data)
+                                                   for i, data in enumerate(picks)])
+
+    def images_to_pdf(rng):
+        picks = [rng.choice(payloads.photos) for _ in range(rng.randint(1, 5))]
+        return _multipart_request("/images-to-pdf", fields=[("pagesize", rng.choice(("auto", "a4")))],
+                                  files=[("images", f"scan{i}.jpg", "image/jpeg", data)
+                                         for i, data in enumerate(picks)])
+
+    def pdf_to_images(rng):
+        return _multipart_request("/pdf-to-images", fields=[("dpi", "100")],
+                                  files=[("pdf", "doc.pdf", "application/pdf", payloads.small_pdfs[0])])
+
+    def split(rng):
+        return _multipart_request("/split", fields=[("pages", "1-3,10,20-25")],
+                                  files=[("pdf", "long.pdf", "application/pdf", payloads.long_pdf)])
+
+    def extract_text(rng):
+        return _multipart_request("/extract-text",
+                                  files=[("pdf", "doc.pdf", "application/pdf", rng.choice(payloads.small_pdfs))])
+
+    return {
+        "page": (10, lambda rng: ("GET", "/", None, {})),
+        "merge": (25, merge),
+        "images-to-pdf": (20, images_to_pdf),
+        "pdf-to-images": (10, pdf_to_images),
+        "split": (15, split),
+        "extract-text": (20, extract_text),
+    }
+
+
+APPS = {
+    "text": {"dir": "textEditorApp", "wsgi": "main:app", "asgi": "main:asgi_app", "payloads": TextPayloads, "scenarios": _text_scenarios},
+    "pdf": {"dir": "pdfApp", "wsgi": "app:app", "asgi": "app:asgi_app", "payloads": PdfPayloads, "scenarios": _pdf_scenarios},
+}
+
+
+# ---- server ----
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app_name, workers, extra_args, scratch, asgi=False):
+    port = _free_port()
+    env = dict(os.environ,
+               LOGIN_DISABLED="1", RATELIMIT_ENABLED="0",
+               SESSION_SECRET="loadtest", SECRET_KEY="loadtest",
+               DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'loadtest.sqlite3')}",
+               PDF_INDEX_PATH=os.path.join(scratch, "pdf_index.sqlite3"))
+    cmd = [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}",
+           "--log-level", "warning", *extra_args]
+    if asgi:
+        cmd += ["--worker-class", "uvicorn.workers.UvicornWorker", APPS[app_name]["asgi"]]
+    else:
+        cmd.append(APPS[app_name]["wsgi"])
+    proc = subprocess.Popen(cmd, cwd=os.path.join(ROOT, APPS[app_name]["dir"]), env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with status {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("server did not start within 30s")
+
+
+def _children():
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as fh:
+                # The command name may contain spaces; ppid follows the closing paren
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def tree_rss_bytes(pid):
+    """Resident memory of ``pid`` and all its descendants (0 where unavailable)."""
+    if pid is None or not os.path.isdir("/proc"):
+        return 0
+    children = _children()
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, ()))
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+
+# ---- load ----
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (start offset s, scenario, status, latency s)
+        self.lock = threading.Lock()
+
+    def add(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    def since(self, index):
+        with self.lock:
+            return self.samples[index:], len(self.samples)
+
+
+def virtual_user(user_id, url, scenarios, think_ms, t0, stop_at, recorder, timeout):
+    rng = random.Random(user_id)
+    names = list(scenarios)
+    weights = [scenarios[name][0] for name in names]
+    parsed = urllib.parse.urlsplit(url)
+    conn = None
+    while time.monotonic() < stop_at:
+        name = rng.choices(names, weights)[0]
+        method, path, body, headers = scenarios[name][1](rng)
+        if conn is None:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=timeout)
+        start = time.monotonic()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+            conn = None
+        recorder.add((start - t0, name, status, time.monotonic() - start))
+        if think_ms:
+            time.sleep(min(rng.expovariate(1000 / think_ms), 10 * think_ms / 1000))
+
+
+def summarize(samples, seconds):
+    latencies = sorted(s[3] for s in samples)
+    # Anything but 200 counts: pdfApp reports failures as a flash plus redirect
+    errors = sum(1 for s in samples if s[2] != 200)
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+    }
+
+
+def run_load(url, scenarios, users, duration, warmup, ramp, think_ms, interval, pid, timeout):
+    recorder = Recorder()
+    t0 = time.monotonic()
+    stop_at = t0 + warmup + duration
+    threads = []
+    for user_id in range(users):
+        thread = threading.Thread(target=virtual_user, daemon=True,
+                                  args=(user_id, url, scenarios, think_ms, t0, stop_at, recorder, timeout))
+        threads.append(thread)
+
+    def ramp_up():
+        for thread in threads:
+            thread.start()
+            time.sleep(ramp / users)
+
+    threading.Thread(target=ramp_up, daemon=True).start()
+
+    timeline = []
+    index = 0
+    next_tick = t0 + interval
+    while time.monotonic() < stop_at:
+        time.sleep(max(0.0, min(next_tick, stop_at) - time.monotonic()))
+        window, index = recorder.since(index)
+        point = summarize(window, interval)
+        row = {"t": round(time.monotonic() - t0, 1), "rps": point["throughput_rps"], "p95_ms": point["p95_ms"],
+               "error_rate": point["error_rate"], "rss_mb": round(tree_rss_bytes(pid) / 2 ** 20, 1)}
+        timeline.append(row)
+        print(f"t={row['t']:>6}s {row['rps']:>8.1f} req/s  p95 {row['p95_ms']:>8.1f} ms  "
+              f"errors {row['error_rate']:>6.1%}  rss {row['rss_mb']:>8.1f} MB", flush=True)
+        next_tick += interval
+    for thread in threads:
+        if thread.ident is not None:
+            thread.join(timeout + 1)
+
+    measured = [s for s in recorder.samples if s[0] >= warmup]
+    by_scenario = {}
+    for sample in measured:
+        by_scenario.setdefault(sample[1], []).append(sample)
+    return {
+        "overall": summarize(measured, duration),
+        "scenarios": {name: summarize(rows, duration) for name, rows in sorted(by_scenario.items())},
+        "timeline": timeline,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions against an earlier run."""
+    failures = []
+    current = dict(results["scenarios"], overall=results["overall"])
+    previous = dict(baseline["scenarios"], overall=baseline["overall"])
+    for name, row in current.items():
+        base = previous.get(name)
+        if base is None or not base["requests"]:
+            continue
+        if row["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            failures.append(f"{name}: {row['throughput_rps']} req/s < baseline {base['throughput_rps']} req/s")
+        for key in ("p95_ms", "p99_ms"):
+            # A few ms of jitter is not a regression on very fast endpoints
+            if row[key] > base[key] * (1 + tolerance) + 5:
+                failures.append(f"{name}: {key} {row[key]} > baseline {base[key]}")
+        if row["error_rate"] > base["error_rate"] + 0.01:
+            failures.append(f"{name}: error rate {row['error_rate']:.2%} > baseline {base['error_rate']:.2%}")
+    return failures
+
+
+def parse_mix(value, scenarios):
+    """``"merge=3,split=1"`` -> only those scenarios, with those weights."""
+    if not value:
+        return scenarios
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in scenarios:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(scenarios)}")
+        mix[name] = (float(weight or scenarios[name][0]), scenarios[name][1])
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app", choices=sorted(APPS))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds, after warm-up")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds excluded from the summary")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which users are started")
+    parser.add_argument("--think-ms", type=float, default=250, help="mean pause between a user's requests")
+    parser.add_argument("--interval", type=float, default=5, help="timeline resolution in seconds")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--mix", default="", help="scenario weights, e.g. count-text=80,seo-analysis=20")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers for the spawned server")
+    parser.add_argument("--asgi", action="store_true", help="serve the ASGI entry point with uvicorn workers")
+    parser.add_argument("--server-arg", action="append", default=[], help="extra Gunicorn argument (repeatable)")
+    parser.add_argument("--url", help="use an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="with --url: server process whose tree RSS is sampled")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to check against")
+    parser.add_argument("--tolerance", type=float, default=0.20)
+    args = parser.parse_args()
+
+    app = APPS[args.app]
+    print("generating payloads...", flush=True)
+    scenarios = parse_mix(args.mix, app["scenarios"](app["payloads"]()))
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as scratch:
+        proc = None
+        url, pid = args.url, args.pid
+        if not url:
+            proc, url = start_server(args.app, args.workers, args.server_arg, scratch, args.asgi)
+            pid = proc.pid
+        try:
+            print(f"{args.users} users against {url} for {args.warmup:g}+{args.duration:g}s", flush=True)
+            results = run_load(url, scenarios, args.users, args.duration, args.warmup, args.ramp,
+                               args.think_ms, args.interval, pid, args.timeout)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(30)
+
+    results = {
+        "app": args.app,
+        "config": {"users": args.users, "duration": args.duration, "warmup": args.warmup,
+                   "think_ms": args.think_ms, "workers": None if args.url else args.workers,
+                   "asgi": args.asgi, "server_args": args.server_arg,
+                   "mix": {name: weight for name, (weight, _) in scenarios.items()}},
+        **results,
+    }
+
+    print(f"\n{'scenario':<16}{'requests':>10}{'req/s':>10}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in list(results["scenarios"].items()) + [("overall", results["overall"])]:
+        print(f"{name:<16}{row['requests']:>10}{row['throughput_rps']:>10.1f}{row['error_rate']:>9.1%}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    peak = max((row["rss_mb"] for row in results["timeline"]), default=0)
+    print(f"peak server RSS: {peak:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=1)
+            fh.write("\n")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            failures = compare(results, json.load(fh), args.tolerance)
+        for failure in failures:
+            print("REGRESSION", failure, file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1 @@
-web: python app.py
\ No newline at end of file
+web: uvicorn app:asgi_app --host 0.0.0.0 --port ${PORT:-8080}
\ No newline at end of file
@@ -1,25 +1,80 @@
+import hashlib
 import io
+import json
+import logging
 import os
+import secrets
+import tempfile
+import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
-from flask import Flask, request, send_file, render_template_string, redirect, url_for, flash
+from flask import Flask, Response, request, send_file, render_template_string, redirect, url_for, flash, jsonify, session
+from werkzeug.http import http_date
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 
 # Pure-Python / manylinux wheels (no OS deps):
-# pypdf for PDF merging/splitting, Pillow for image handling, PyMuPDF for PDF->images
-from pypdf import PdfWriter, PdfReader
+# Pillow for image handling, PyMuPDF for everything PDF
 from PIL import Image
 import fitz  # PyMuPDF
 
+from profiling import init_profiling
+from ratelimit import charge, init_rate_limiting, rate_limited
+from search_index import PdfTextIndex, SearchQueryError
+from stamp import LAYERS, POSITIONS, image_stamp, stamp_pdf, text_stamp
+from archives import ORDERS, ArchiveError, MemberError, is_archive, iter_members, natural_key
+from artifacts import Artifact, ArtifactStore
+from asgi import AsgiBridge
+from pdf_optimize import DEFAULT_LEVEL, LEVELS, optimize_doc, optimize_pdf
+from timing import current_timings, init_timing, stage
+
 # ---- Config ----
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret")
 # Limit upload size (adjust for your host). 50 MB total is friendly to free tiers.
 app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+# Served behind the host's router: trust that many X-Forwarded-* hops, so
+# remote_addr (which rate limiting keys on) is the client, not the router.
+# Set TRUSTED_PROXY_HOPS=0 when clients connect directly.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS, x_host=TRUSTED_PROXY_HOPS)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+# Named stage timers -> Server-Timing header + one JSON log line per request; see timing.py
+init_timing(app)
+# Opt-in request profiling (X-Profile header / PROFILE_SAMPLE_RATE); see profiling.py
+init_profiling(app)
+# Per-client token buckets (RATELIMIT_RATE/RATELIMIT_BURST/RATELIMIT_STORE); see ratelimit.py
+init_rate_limiting(app)
+# Text extraction fans pages out to worker processes in chunks of this many pages
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_CHUNK_PAGES = int(os.environ.get("EXTRACT_CHUNK_PAGES", "8"))
+# Optional full-text index of extracted PDFs (SQLite FTS5); each browser
+# session searches only what it indexed itself
+PDF_INDEX_PATH = os.environ.get("PDF_INDEX_PATH", os.path.join(app.instance_path, "pdf_index.sqlite3"))
+MAX_SEARCH_DOCS = 50
+# Results are kept on disk for resumable and ranged downloads; see artifacts.py
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(app.instance_path, "artifacts"))
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", "3600"))
+# /merge with one ZIP/TAR upload: caps on its files and decompressed size
+ARCHIVE_MAX_MEMBERS = int(os.environ.get("ARCHIVE_MAX_MEMBERS", "5000"))
+ARCHIVE_MAX_BYTES = int(os.environ.get("ARCHIVE_MAX_MB", "200")) * 1024 * 1024
+# /merge writes its output to a temporary file every this many input bytes
+# and reopens it from there, so only what was added since is held in memory
+MERGE_FLUSH_BYTES = int(os.environ.get("MERGE_FLUSH_MB", "32")) * 1024 * 1024
+# Skipped files beyond this many are summed up in one message
+MAX_SKIP_MESSAGES = 10
+# Images → PDF: Pillow decodes no frame to more than this many bytes at the
+# frame's own bit depth (a 600 DPI A3 bitonal scan is ~8.7 MB). Larger JPEGs
+# are decoded at 1/2..1/8 scale; frames still over it are handed to MuPDF
+IMAGE_DECODE_BUDGET = int(os.environ.get("IMAGE_DECODE_MB", "150")) * 1024 * 1024
+IMAGE_JPEG_QUALITY = 90
+# Page sizes in points (72 per inch)
+PAGE_SIZES = {"a4": (595, 842), "letter": (612, 792)}
 ALLOWED_PDF = {"pdf"}
-ALLOWED_IMG = {"png", "jpg", "jpeg", "webp", "bmp", "tiff"}
+ALLOWED_IMG = {"png", "jpg", "jpeg", "webp", "bmp", "tiff", "tif"}
 
 # ---- UI Template (kept inline so it's truly one file) ----
 PAGE = """
@@ -52,9 +107,24 @@ PAGE = """
   <section>
     <h2>1) Merge PDFs → single PDF</h2>
     <form class="grid" action="{{ url_for('merge') }}" method="post" enctype="multipart/form-data">
-      <input type="file" name="files" accept="application/pdf" multiple required />
+      <input type="file" name="files" accept="application/pdf,.zip,.tar,.tgz,.gz,.bz2,.xz" multiple required />
+      <label>Order inside a ZIP/TAR:
+        <select name="order">
+          <option value="name" selected>By file name (2 before 10)</option>
+          <option value="archive">As stored in the archive</option>
+        </select>
+      </label>
+      <label>Optimize:
+        <select name="optimize">
+          <option value="lossless" selected>Lossless (smaller, identical pages)</option>
+          <option value="balanced">Balanced (images ≤ 150 DPI)</option>
+          <option value="aggressive">Aggressive (images ≤ 96 DPI)</option>
+          <option value="none">None</option>
+        </select>
+      </label>
+      <label>Image DPI (optional, any level but None): <input type="number" name="image_dpi" min="36" max="600" placeholder="level default" /></label>
       <button type="submit">Merge PDFs</button>
-      <div class="tip">Tip: Use the Files picker on iOS to select multiple PDFs. Order is kept as selected; if your host reorders, we sort by filename.</div>
+      <div class="tip">Tip: Use the Files picker on iOS to select multiple PDFs. Files are merged in filename order (2 before 10). For hundreds of PDFs, upload one .zip or .tar(.gz) instead.</div>
     </form>
   </section>
 
@@ -69,6 +139,15 @@ PAGE = """
           <option value="Letter">Letter Portrait</option>
         </select>
       </label>
+      <label>Optimize:
+        <select name="optimize">
+          <option value="lossless" selected>Lossless (smaller, identical pages)</option>
+          <option value="balanced">Balanced (images ≤ 150 DPI)</option>
+          <option value="aggressive">Aggressive (images ≤ 96 DPI)</option>
+          <option value="none">None</option>
+        </select>
+      </label>
+      <label>Image DPI (optional, any level but None): <input type="number" name="image_dpi" min="36" max="600" placeholder="level default" /></label>
       <button type="submit">Convert to PDF</button>
       <div class="tip">Supported: PNG, JPG, JPEG, WEBP, BMP, TIFF.</div>
     </form>
@@ -84,6 +163,60 @@ PAGE = """
     </form>
   </section>
 
+  <section>
+    <h2>4) Split / extract pages</h2>
+    <form class="grid" action="{{ url_for('split') }}" method="post" enctype="multipart/form-data">
+      <input type="file" name="pdf" accept="application/pdf" required />
+      <label>Pages: <input type="text" name="pages" placeholder="e.g. 1-3, 7, 10-" /></label>
+      <label>or split every <input type="number" name="every" min="1" placeholder="N" /> pages</label>
+      <label>Output:
+        <select name="output">
+          <option value="pdf" selected>One PDF with the selected pages</option>
+          <option value="zip">ZIP with one PDF per range</option>
+        </select>
+      </label>
+      <button type="submit">Extract pages</button>
+      <div class="tip">Only the chosen pages (and what they use) are copied, so big files stay fast.</div>
+    </form>
+  </section>
+
+  <section>
+    <h2>5) Stamp / watermark</h2>
+    <form class="grid" action="{{ url_for('stamp') }}" method="post" enctype="multipart/form-data">
+      <input type="file" name="pdf" accept="application/pdf" required />
+      <label>Text: <input type="text" name="text" placeholder="e.g. CONFIDENTIAL" /></label>
+      <label>or image: <input type="file" name="image" accept="image/*" /></label>
+      <label>Position:
+        <select name="position">
+          <option value="diagonal" selected>Diagonal across the page</option>
+          <option value="center">Across the middle</option>
+          <option value="top">Top</option>
+          <option value="bottom">Bottom</option>
+        </select>
+      </label>
+      <label>Opacity: <input type="number" name="opacity" value="30" min="5" max="100" /> %</label>
+      <label>Color: <input type="color" name="color" value="#808080" /></label>
+      <label>Footer (optional): <input type="text" name="footer" placeholder="e.g. Acme Corp — internal use only" /></label>
+      <label><input type="checkbox" name="layer" value="under" /> Behind the page content</label>
+      <button type="submit">Stamp every page</button>
+      <div class="tip">The stamp is stored once and shared by all pages, so even long documents barely grow.</div>
+    </form>
+  </section>
+
+  <section>
+    <h2>6) PDF → Text</h2>
+    <form class="grid" action="{{ url_for('extract_text') }}" method="post" enctype="multipart/form-data">
+      <input type="file" name="pdf" accept="application/pdf" required />
+      <label><input type="checkbox" name="index" value="1" /> Add to my search index (the extracted text is kept on this server)</label>
+      <button type="submit">Extract text (.txt)</button>
+      <div class="tip">Pages are separated by a form feed. PDFs you index are searchable below from this browser only, and are not re-parsed when uploaded again.</div>
+    </form>
+    <form class="grid" action="{{ url_for('search') }}" method="get">
+      <input type="search" name="q" placeholder="Search my indexed PDFs" required />
+      <button type="submit">Search</button>
+    </form>
+  </section>
+
   <footer>
     <div>Max upload total: {{ max_mb }} MB. Time: {{ now }}</div>
   </footer>
@@ -94,103 +227,256 @@ PAGE = """
 def _ext_ok(filename: str, allowed: set) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in allowed
 
+def _optimize_settings() -> Tuple[str, Optional[int]]:
+    level = (request.form.get("optimize") or DEFAULT_LEVEL).lower()
+    if level not in LEVELS:
+        level = DEFAULT_LEVEL
+    image_dpi = request.form.get("image_dpi", type=int)
+    if image_dpi is not None:
+        image_dpi = max(36, min(image_dpi, 600))
+    return level, image_dpi
+
+def _send_optimized_pdf(data: bytes, out_name: str):
+    """Run the requested size optimization and send the PDF, reporting
+    sizes in X-Original-Bytes / X-Optimized-Bytes."""
+    level, image_dpi = _optimize_settings()
+    with stage("optimize", bytes_in=len(data)) as s:
+        data, before, after = optimize_pdf(data, level, image_dpi)
+        s.count(bytes_out=after)
+    with stage("artifact-write", bytes=len(data)):
+        artifact = _get_artifact_store().save(data, out_name, "application/pdf")
+    response = _send_artifact(artifact)
+    response.headers["X-Original-Bytes"] = str(before)
+    response.headers["X-Optimized-Bytes"] = str(after)
+    return response
+
+def _send_optimized_doc(doc, out_name: str, input_bytes: int):
+    """Optimize a PDF built in memory and save it straight into an
+    artifact, then close it: one serialization, and no copy of the whole
+    file as bytes. X-Original-Bytes is ``input_bytes``, what went into it."""
+    level, image_dpi = _optimize_settings()
+    try:
+        with stage("optimize", pages=doc.page_count):
+            options = optimize_doc(doc, level, image_dpi)
+        writer = _get_artifact_store().create(out_name, "application/pdf")
+        try:
+            with stage("pdf-write", pages=doc.page_count) as s:
+                doc.save(writer, **options)
+                s.count(bytes=writer.tell())
+        except BaseException:
+            writer.discard()
+            raise
+    finally:
+        doc.close()
+    artifact = writer.commit()
+    response = _send_artifact(artifact)
+    response.headers["X-Original-Bytes"] = str(input_bytes)
+    response.headers["X-Optimized-Bytes"] = str(artifact.size)
+    return response
+
+_artifact_store = None
+
+def _get_artifact_store() -> ArtifactStore:
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_TTL)
+    return _artifact_store
+
+def _artifact_headers(artifact_id: str, expires: float) -> dict:
+    return {
+        "X-Artifact-Id": artifact_id,
+        "X-Artifact-Expires": http_date(expires),
+        # Where to resume, or fetch ranges in parallel, if this download breaks
+        "Content-Location": url_for("get_artifact", artifact_id=artifact_id),
+    }
+
+def _send_artifact(artifact: Artifact):
+    # conditional=True handles Range, If-Range and If-None-Match on GET/HEAD
+    response = send_file(artifact.path, mimetype=artifact.mimetype, as_attachment=True,
+                         download_name=artifact.filename, conditional=True)
+    response.cache_control.private = True
+    response.headers.update(_artifact_headers(artifact.id, artifact.expires))
+    return response
+
+def _upload_cost() -> float:
+    # Rate-limit cost: one token per request plus one per uploaded MB
+    return 1 + (request.content_length or 0) / (1024 * 1024)
+
+def _render_cost(pages: int, dpi: int) -> float:
+    # One token per page at 72 DPI; pixel count grows with DPI squared
+    return pages * (dpi / 72.0) ** 2
+
 @app.route("/", methods=["GET"])
 def index():
-    return render_template_string(PAGE, max_mb=int(app.config["MAX_CONTENT_LENGTH"]/1024/1024), now=datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC"))
+    with stage("template"):
+        return render_template_string(PAGE, max_mb=int(app.config["MAX_CONTENT_LENGTH"]/1024/1024), now=datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC"))
 
 @app.post("/merge")
+@rate_limited(_upload_cost)
 def merge():
-    files = request.files.getlist("files")
+    with stage("upload", bytes=request.content_length or 0) as s:
+        files = request.files.getlist("files")
+        s.count(files=len(files))
     if not files:
         flash("No files uploaded.")
         return redirect(url_for("index"))
 
-    pdfs = []
-    for f in files:
-        filename = secure_filename(f.filename or "")
-        if not filename or not _ext_ok(filename, ALLOWED_PDF):
-            flash(f"Skipping non-PDF: {filename}")
-            continue
-        pdfs.append( (filename, io.BytesIO(f.read())) )
+    if len(files) == 1 and is_archive(files[0].filename or ""):
+        order = request.form.get("order") or "name"
+        if order not in ORDERS:
+            order = "name"
+        # Members are decompressed one at a time, as they are merged
+        sources = ((member.name, member.read) for member in iter_members(
+            files[0].stream, files[0].filename, order, ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_BYTES))
+    else:
+        # Natural filename order keeps the result deterministic if the host
+        # reorders uploads; each file is read only when its turn comes
+        files.sort(key=lambda f: natural_key(secure_filename(f.filename or "")))
+        sources = ((secure_filename(f.filename or ""), f.read) for f in files)
 
-    if not pdfs:
-        flash("No valid PDFs found.")
-        return redirect(url_for("index"))
+    # Only the source being appended is held in memory: it is read, parsed,
+    # copied into the output and closed before the next one is opened.
+    # (insert_pdf copies what the pages use; pypdf's PdfWriter would keep
+    # every source reader alive until the end.) The output is flushed to a
+    # temporary file every MERGE_FLUSH_BYTES, so it doesn't accumulate in
+    # memory either: peak memory follows the largest source, not the total.
+    out = fitz.open()
+    spool_path = None
+    skipped = []
+    input_bytes = unflushed = 0
+    try:
+        try:
+            for name, read in sources:
+                with stage("validate"):
+                    if not name or not _ext_ok(name, ALLOWED_PDF):
+                        skipped.append(f"Skipping non-PDF: {name}")
+                        continue
+                src = None
+                try:
+                    with stage("read") as s:
+                        data = read()
+                        s.count(bytes=len(data))
+                    with stage("pdf-parse", files=1) as s:
+                        src = fitz.open(stream=data, filetype="pdf")
+                        if src.needs_pass:
+                            raise ValueError("encrypted")
+                        s.count(pages=len(src))
+                    with stage("merge", pages=len(src)):
+                        out.insert_pdf(src)
+                    input_bytes += len(data)
+                    unflushed += len(data)
+                except MemberError as e:
+                    skipped.append(f"Skipping {name}: {e}")
+                except ArchiveError:
+                    raise
+                except Exception:
+                    skipped.append(f"Skipping unreadable PDF: {name}")
+                finally:
+                    if src is not None:
+                        src.close()
+                    data = None
+                if unflushed >= MERGE_FLUSH_BYTES:
+                    out, spool_path = _flush_merged(out, spool_path)
+                    unflushed = 0
+        except ArchiveError as e:
+            out.close()
+            flash(str(e))
+            return redirect(url_for("index"))
 
-    # Sort by filename to keep a deterministic order if host reorders uploads
-    pdfs.sort(key=lambda x: x[0].lower())
+        # A 1000-file archive can skip a lot; the session cookie holds only so much
+        for message in skipped[:MAX_SKIP_MESSAGES]:
+            flash(message)
+        if len(skipped) > MAX_SKIP_MESSAGES:
+            flash(f"...and {len(skipped) - MAX_SKIP_MESSAGES} more skipped.")
+        if not out.page_count:
+            out.close()
+            flash("No valid PDFs found.")
+            return redirect(url_for("index"))
 
-    writer = PdfWriter()
-    for name, buf in pdfs:
-        buf.seek(0)
-        reader = PdfReader(buf)
-        for page in reader.pages:
-            writer.add_page(page)
+        out_name = f"merged_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
+        response = _send_optimized_doc(out, out_name, input_bytes)
+        response.headers["X-Skipped-Files"] = str(len(skipped))
+        return response
+    finally:
+        if spool_path is not None:
+            os.remove(spool_path)
 
-    out = io.BytesIO()
-    writer.write(out)
-    writer.close()
-    out.seek(0)
-    out_name = f"merged_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return send_file(out, as_attachment=True, download_name=out_name, mimetype="application/pdf")
+def _flush_merged(doc, path: Optional[str]):
+    """Append what was added to ``doc`` since the last flush to the file at
+    ``path`` (a new temporary file the first time), then reopen the document
+    from it, so MuPDF drops the flushed objects and reads them back only
+    when the result is saved. Returns ``(doc, path)``."""
+    with stage("merge-flush", pages=doc.page_count):
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".pdf", prefix="merge-")
+            os.close(fd)
+            doc.save(path)
+        else:
+            doc.saveIncr()
+        doc.close()
+        return fitz.open(path), path
 
 @app.post("/images-to-pdf")
+@rate_limited(_upload_cost)
 def images_to_pdf():
-    files = request.files.getlist("images")
+    with stage("upload", bytes=request.content_length or 0) as s:
+        files = request.files.getlist("images")
+        s.count(files=len(files))
     pagesize = (request.form.get("pagesize") or "auto").lower()
     if not files:
         flash("No images uploaded.")
         return redirect(url_for("index"))
 
-    images: List[Image.Image] = []
+    # Pages are written one frame at a time: only the current frame is ever
+    # decoded, and it is released before the next one is loaded.
+    out = fitz.open()
+    input_bytes = 0
     for f in files:
-        name = secure_filename(f.filename or "")
-        if not name or not _ext_ok(name, ALLOWED_IMG):
-            flash(f"Skipping non-image: {name}")
+        with stage("validate"):
+            name = secure_filename(f.filename or "")
+            if not name or not _ext_ok(name, ALLOWED_IMG):
+                flash(f"Skipping non-image: {name}")
+                continue
+        try:
+            # Large uploads are spooled to disk by Werkzeug; read from there
+            with stage("image-open", files=1):
+                img = Image.open(f.stream)
+        except (OSError, Image.DecompressionBombError):
+            flash(f"Skipping unreadable image: {name}")
             continue
-        img = Image.open(io.BytesIO(f.read()))
-        # Convert all to RGB for PDF
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        images.append(img)
+        # The upload opened by MuPDF, for frames too big for Pillow
+        whole = None
+        with img:
+            # Multi-page TIFF scans: every frame becomes a page
+            frames = img.n_frames if img.format == "TIFF" else 1
+            for index in range(frames):
+                try:
+                    img.seek(index)
+                    size, mode = img.size, img.mode
+                    try:
+                        input_bytes += _add_image_page(out, img, pagesize)
+                    except FrameTooLarge:
+                        if whole is None:
+                            whole = _open_image_doc(f.stream, img.format)
+                        input_bytes += _add_whole_image_page(out, whole, index, size, mode, pagesize)
+                except (OSError, Image.DecompressionBombError):
+                    flash(f"Skipping unreadable page {index + 1} of {name}")
+                except ValueError as e:
+                    flash(f"Skipping page {index + 1} of {name}: {e}")
+        if whole is not None:
+            whole.close()
 
-    if not images:
+    if not out.page_count:
+        out.close()
         flash("No valid images found.")
         return redirect(url_for("index"))
 
-    # Optional page size
-    def to_a4(img: Image.Image):
-        # A4 at 72 DPI ~ 595x842 pt. We'll fit the image within while preserving aspect.
-        A4 = (595, 842)
-        return _fit_to_canvas(img, A4)
-
-    def to_letter(img: Image.Image):
-        # Letter at 72 DPI ~ 612x792 pt.
-        LTR = (612, 792)
-        return _fit_to_canvas(img, LTR)
-
-    processed = []
-    for img in images:
-        if pagesize == "a4":
-            processed.append(to_a4(img))
-        elif pagesize == "letter":
-            processed.append(to_letter(img))
-        else:
-            processed.append(img)
-
-    out = io.BytesIO()
-    if len(processed) == 1:
-        processed[0].save(out, format="PDF")
-    else:
-        processed[0].save(out, format="PDF", save_all=True, append_images=processed[1:])
-    out.seek(0)
     out_name = f"images_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return send_file(out, as_attachment=True, download_name=out_name, mimetype="application/pdf")
+    return _send_optimized_doc(out, out_name, input_bytes)
 
-def _fit_to_canvas(img: Image.Image, canvas_size):
-    # Letter/A4: paste image centered onto a white canvas while preserving aspect
-    bg = Image.new("RGB", canvas_size, (255, 255, 255))
-    img_ratio = img.width / img.height
+def _fit_size(size, canvas_size):
+    # Largest size with the image's aspect ratio that fits inside the canvas
+    img_ratio = size[0] / size[1]
     can_ratio = canvas_size[0] / canvas_size[1]
     if img_ratio > can_ratio:
         # Fit to width
@@ -199,43 +485,526 @@ def _fit_to_canvas(img: Image.Image, canvas_size):
     else:
         new_h = canvas_size[1]
         new_w = int(new_h * img_ratio)
-    resized = img.resize((new_w, new_h))
-    x = (canvas_size[0] - new_w) // 2
-    y = (canvas_size[1] - new_h) // 2
-    bg.paste(resized, (x, y))
-    return bg
+    return max(new_w, 1), max(new_h, 1)
+
+class FrameTooLarge(ValueError):
+    """The frame would decode to more than IMAGE_DECODE_BUDGET bytes."""
+
+# Bits per band where it isn't 8
+_MODE_BITS = {"1": 1, "I": 32, "F": 32, "I;16": 16, "I;16L": 16, "I;16B": 16, "I;16N": 16}
+
+def _decoded_bytes(img: Image.Image) -> int:
+    """Size of the current frame decoded at its own bit depth."""
+    bits = _MODE_BITS.get(img.mode, 8) * len(img.getbands())
+    return -(-img.width * img.height * bits // 8)
+
+def _draft_jpeg(img: Image.Image, target) -> None:
+    """Have the JPEG decoder scale by the largest power of two (up to 8)
+    that keeps the frame at least ``target`` and within IMAGE_DECODE_BUDGET;
+    only the reduced raster is ever decoded."""
+    width, height = img.size
+    full = _decoded_bytes(img)
+    scale = 1
+    while scale < 8 and (full > IMAGE_DECODE_BUDGET * scale * scale
+                         or (width // (scale * 2) >= target[0] and height // (scale * 2) >= target[1])):
+        scale *= 2
+    if scale > 1:
+        img.draft("RGB" if img.mode not in ("L", "1") else img.mode,
+                  (-(-width // scale), -(-height // scale)))
+
+def _add_image_page(out, img: Image.Image, pagesize: str) -> int:
+    """Decode the current frame of ``img`` within IMAGE_DECODE_BUDGET and
+    append it to ``out`` as one page; FrameTooLarge if it can't be kept
+    within it, ValueError if it can't be added at all. Returns the size of
+    the encoded image inserted."""
+    # Auto: page is the image size in points, the raster kept as decoded
+    page_w, page_h = img.size
+    if pagesize in PAGE_SIZES:
+        # A4/Letter: image centered on the page, scaled to fit (72 DPI pixels as before)
+        page_w, page_h = PAGE_SIZES[pagesize]
+
+    if img.format == "JPEG":
+        _draft_jpeg(img, _fit_size(img.size, (page_w, page_h)))
+    # Checked before anything is decoded: load() allocates the full frame
+    if _decoded_bytes(img) > IMAGE_DECODE_BUDGET:
+        raise FrameTooLarge(f"{img.width}x{img.height} {img.mode} is over the decode budget")
+
+    with stage("image-decode", frames=1, pixels=img.width * img.height):
+        target = _fit_size(img.size, (page_w, page_h)) if pagesize in PAGE_SIZES else img.size
+
+        # Palette images are resampled in color; everything else is shrunk
+        # first, so the mode conversion only copies the smaller raster
+        frame = img.convert("RGB") if img.mode in ("P", "PA") else img
+        if frame.size != target:
+            frame = frame.resize(target, reducing_gap=2.0)
+        if frame.mode not in ("RGB", "L", "1"):
+            frame = frame.convert("RGB")
+
+    buf = io.BytesIO()
+    with stage("image-encode") as s:
+        if frame.mode == "1":
+            # Bitonal scans compress far better losslessly than as JPEG
+            frame.save(buf, format="PNG")
+        else:
+            frame.save(buf, format="JPEG", quality=IMAGE_JPEG_QUALITY)
+        s.count(bytes=buf.tell())
+    del frame
+
+    with stage("pdf-insert", pages=1):
+        page = out.new_page(width=page_w, height=page_h)
+        x = (page_w - target[0]) / 2 if pagesize in PAGE_SIZES else 0
+        y = (page_h - target[1]) / 2 if pagesize in PAGE_SIZES else 0
+        w, h = (target if pagesize in PAGE_SIZES else (page_w, page_h))
+        page.insert_image(fitz.Rect(x, y, x + w, y + h), stream=buf.getvalue(), keep_proportion=False)
+    return buf.tell()
+
+def _open_image_doc(stream, fmt: str):
+    """Open an uploaded image with MuPDF, one page per frame."""
+    stream.seek(0)
+    try:
+        return fitz.open(stream=stream.read(), filetype=fmt.lower())
+    except (RuntimeError, ValueError) as e:
+        raise ValueError(f"it is too large to decode and MuPDF can't open it ({e})")
+
+def _add_whole_image_page(out, doc, index: int, size, mode: str, pagesize: str) -> int:
+    """Append frame ``index`` of the MuPDF image document ``doc`` as one
+    page laid out like _add_image_page, for frames over IMAGE_DECODE_BUDGET:
+    MuPDF decodes the frame natively and renders it straight at the page's
+    raster size, with no Python-side copies. ``size`` and ``mode`` are the
+    frame's, as Pillow reads them. Returns the size of the encoded image
+    inserted."""
+    page_w, page_h = PAGE_SIZES.get(pagesize, size)
+    w, h = _fit_size(size, (page_w, page_h)) if pagesize in PAGE_SIZES else size
+    src = doc[index]
+    with stage("image-decode", frames=1, pixels=size[0] * size[1]):
+        pix = src.get_pixmap(matrix=fitz.Matrix(w / src.rect.width, h / src.rect.height),
+                             colorspace=fitz.csGRAY if mode in ("1", "L") else fitz.csRGB, alpha=False)
+    with stage("image-encode") as s:
+        # Bitonal scans compress far better losslessly than as JPEG
+        data = pix.tobytes("png") if mode == "1" else pix.tobytes("jpeg", jpg_quality=IMAGE_JPEG_QUALITY)
+        s.count(bytes=len(data))
+    del pix
+
+    with stage("pdf-insert", pages=1):
+        page = out.new_page(width=page_w, height=page_h)
+        x, y = (page_w - w) / 2, (page_h - h) / 2
+        page.insert_image(fitz.Rect(x, y, x + w, y + h), stream=data, keep_proportion=False)
+    return len(data)
 
 @app.post("/pdf-to-images")
 def pdf_to_images():
-    f = request.files.get("pdf")
+    with stage("upload", bytes=request.content_length or 0):
+        f = request.files.get("pdf")
     if not f:
         flash("No PDF uploaded.")
         return redirect(url_for("index"))
-    name = secure_filename(f.filename or "")
-    if not _ext_ok(name, ALLOWED_PDF):
-        flash("Please upload a .pdf file.")
-        return redirect(url_for("index"))
+    with stage("validate"):
+        name = secure_filename(f.filename or "")
+        if not _ext_ok(name, ALLOWED_PDF):
+            flash("Please upload a .pdf file.")
+            return redirect(url_for("index"))
 
     dpi = int(request.form.get("dpi") or 144)
-    data = io.BytesIO(f.read())
-    data.seek(0)
+    with stage("read") as s:
+        data = io.BytesIO(f.read())
+        data.seek(0)
+        s.count(bytes=len(data.getbuffer()))
+
+    with stage("pdf-parse") as s:
+        doc = fitz.open(stream=data.getvalue(), filetype="pdf")
+        s.count(pages=len(doc))
+    limited = charge(_render_cost(len(doc), dpi))
+    if limited is not None:
+        doc.close()
+        return limited
+    # Render pages to PNG, collected in a ZIP written straight to the artifact file
+    out_name = f"pdf_images_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
+    writer = _get_artifact_store().create(out_name, "application/zip")
+    try:
+        _render_zip(doc, dpi, writer)
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        doc.close()
+    return _send_artifact(writer.commit())
 
-    doc = fitz.open(stream=data.getvalue(), filetype="pdf")
-    # Render pages to PNG, collect in a ZIP
-    zbuf = io.BytesIO()
-    with zipfile.ZipFile(zbuf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+def _render_zip(doc, dpi: int, out) -> None:
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as z:
         for i, page in enumerate(doc, start=1):
             # scale matrix from DPI; 72 base DPI
             zoom = dpi / 72.0
             mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img_bytes = pix.tobytes("png")
-            z.writestr(f"page_{i:03d}.png", img_bytes)
-    doc.close()
+            with stage("render", pages=1) as s:
+                pix = page.get_pixmap(matrix=mat, alpha=False)
+                s.count(pixels=pix.width * pix.height)
+            with stage("png-encode") as s:
+                img_bytes = pix.tobytes("png")
+                s.count(bytes=len(img_bytes))
+            with stage("zip-deflate", bytes_in=len(img_bytes)):
+                z.writestr(f"page_{i:03d}.png", img_bytes)
 
-    zbuf.seek(0)
-    out_name = f"pdf_images_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
-    return send_file(zbuf, as_attachment=True, download_name=out_name, mimetype="application/zip")
+def _parse_page_ranges(spec: str, page_count: int) -> List[Tuple[int, int]]:
+    """Parse "1-3, 7, 10-" into 0-based inclusive (first, last) ranges."""
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            start = int(first) if first else 1
+            end = (int(last) if last else page_count) if sep else start
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}") from None
+        if not 1 <= start <= end <= page_count:
+            raise ValueError(f"Page range {part} is outside 1-{page_count}")
+        ranges.append((start - 1, end - 1))
+    if not ranges:
+        raise ValueError("Enter pages to extract, e.g. 1-3, 7")
+    return ranges
+
+class _ZipChunks:
+    """Write-only sink for zipfile that hands out what was written so far."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def _copy_pages(src, ranges: List[Tuple[int, int]]):
+    # insert_pdf copies only the referenced page objects and their resources;
+    # final=False keeps the copied-object map so shared resources are copied once
+    out = fitz.open()
+    for i, (first, last) in enumerate(ranges):
+        out.insert_pdf(src, from_page=first, to_page=last, final=(i == len(ranges) - 1))
+    return out
+
+@app.post("/split")
+@rate_limited(_upload_cost)
+def split():
+    with stage("upload", bytes=request.content_length or 0):
+        f = request.files.get("pdf")
+    if not f:
+        flash("No PDF uploaded.")
+        return redirect(url_for("index"))
+    with stage("validate"):
+        name = secure_filename(f.filename or "")
+        if not _ext_ok(name, ALLOWED_PDF):
+            flash("Please upload a .pdf file.")
+            return redirect(url_for("index"))
+
+    try:
+        with stage("pdf-parse") as s:
+            data = f.read()
+            src = fitz.open(stream=data, filetype="pdf")
+            s.count(bytes=len(data), pages=len(src))
+        del data
+    except Exception:
+        flash("Could not read that PDF.")
+        return redirect(url_for("index"))
+
+    every = request.form.get("every", type=int)
+    try:
+        if every:
+            if every < 1:
+                raise ValueError("Split size must be at least 1 page")
+            ranges = [(start, min(start + every, len(src)) - 1) for start in range(0, len(src), every)]
+            separate = True
+        else:
+            ranges = _parse_page_ranges(request.form.get("pages") or "", len(src))
+            separate = request.form.get("output") == "zip"
+    except ValueError as e:
+        src.close()
+        flash(str(e))
+        return redirect(url_for("index"))
+
+    stem = name.rsplit(".", 1)[0]
+    stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+
+    if not separate:
+        with stage("copy-pages", pages=sum(last - first + 1 for first, last in ranges)):
+            out = _copy_pages(src, ranges)
+        with stage("pdf-write") as s:
+            data = out.tobytes()
+            s.count(bytes=len(data))
+        out.close()
+        src.close()
+        with stage("artifact-write", bytes=len(data)):
+            artifact = _get_artifact_store().save(data, f"{stem}_pages_{stamp}.pdf", "application/pdf")
+        return _send_artifact(artifact)
+
+    timings = current_timings()
+    out_name = f"{stem}_split_{stamp}.zip"
+    writer = _get_artifact_store().create(out_name, "application/zip")
+
+    def generate():
+        sink = _ZipChunks()
+        # Streamed to the client and copied to the artifact file as it goes.
+        # If the client drops, the ZIP is still finished on disk so the
+        # download can be resumed from /artifacts/<id>.
+        client_gone = False
+        try:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as z:
+                for first, last in ranges:
+                    with timings.stage("copy-pages", pages=last - first + 1):
+                        part = _copy_pages(src, [(first, last)])
+                    label = f"{first + 1}" if first == last else f"{first + 1}-{last + 1}"
+                    with timings.stage("pdf-write", files=1) as s:
+                        data = part.tobytes()
+                        s.count(bytes=len(data))
+                    z.writestr(f"{stem}_p{label}.pdf", data)
+                    part.close()
+                    chunk = sink.take()
+                    writer.write(chunk)
+                    if not client_gone:
+                        try:
+                            yield chunk
+                        except GeneratorExit:
+                            client_gone = True
+            chunk = sink.take()
+            writer.write(chunk)
+            writer.commit()
+            if not client_gone:
+                yield chunk
+        except BaseException:
+            writer.discard()
+            raise
+        finally:
+            src.close()
+
+    headers = {"Content-Disposition": f"attachment; filename={out_name}"}
+    # Available under this id once the whole ZIP has been produced
+    headers.update(_artifact_headers(writer.id, time.time() + ARTIFACT_TTL))
+    return Response(generate(), mimetype="application/zip", headers=headers)
+
+def _parse_color(value: str) -> Tuple[float, float, float]:
+    # "#rrggbb" from <input type=color>; anything else falls back to gray
+    value = (value or "").lstrip("#")
+    try:
+        return tuple(int(value[i:i + 2], 16) / 255 for i in (0, 2, 4)) if len(value) == 6 else (0.5, 0.5, 0.5)
+    except ValueError:
+        return (0.5, 0.5, 0.5)
+
+@app.post("/stamp")
+@rate_limited(_upload_cost)
+def stamp():
+    with stage("upload", bytes=request.content_length or 0):
+        f = request.files.get("pdf")
+        image = request.files.get("image")
+    if not f:
+        flash("No PDF uploaded.")
+        return redirect(url_for("index"))
+    with stage("validate"):
+        name = secure_filename(f.filename or "")
+        if not _ext_ok(name, ALLOWED_PDF):
+            flash("Please upload a .pdf file.")
+            return redirect(url_for("index"))
+
+    position = request.form.get("position") or "diagonal"
+    layer = request.form.get("layer") or "over"
+    if position not in POSITIONS or layer not in LAYERS:
+        flash("Unknown stamp position or layer.")
+        return redirect(url_for("index"))
+    opacity = max(5, min(request.form.get("opacity", default=30, type=int) or 30, 100)) / 100
+    text = (request.form.get("text") or "").strip()
+    footer = (request.form.get("footer") or "").strip()
+
+    stamps = []
+    with stage("stamp-build") as s:
+        if image and image.filename:
+            if not _ext_ok(secure_filename(image.filename), ALLOWED_IMG):
+                flash("Please upload the stamp as an image.")
+                return redirect(url_for("index"))
+            try:
+                stamps.append(image_stamp(image.read(), position, opacity))
+            except Exception:
+                flash("Could not read the stamp image.")
+                return redirect(url_for("index"))
+        elif text:
+            stamps.append(text_stamp(text, position, _parse_color(request.form.get("color")), opacity))
+        if footer:
+            stamps.append(text_stamp(footer, "bottom"))
+        s.count(stamps=len(stamps))
+    if not stamps:
+        flash("Enter stamp text, choose an image, or add a footer.")
+        return redirect(url_for("index"))
+
+    with stage("read") as s:
+        data = f.read()
+        s.count(bytes=len(data))
+    try:
+        # One pass over the pages; each stamp is a single shared form XObject
+        with stage("stamp") as s:
+            data = stamp_pdf(data, stamps, layer)
+            s.count(bytes_out=len(data))
+    except Exception:
+        flash("Could not read that PDF.")
+        return redirect(url_for("index"))
+    stem = name.rsplit(".", 1)[0]
+    return _send_optimized_pdf(data, f"{stem}_stamped_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf")
+
+@app.get("/artifacts/<artifact_id>")
+def get_artifact(artifact_id: str):
+    artifact = _get_artifact_store().get(artifact_id)
+    if artifact is None:
+        return jsonify({"error": "Unknown or expired artifact"}), 404
+    return _send_artifact(artifact)
+
+_extract_pool = None
+_text_index = None
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        _extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _extract_pool
+
+def _get_text_index() -> PdfTextIndex:
+    global _text_index
+    if _text_index is None:
+        os.makedirs(os.path.dirname(PDF_INDEX_PATH) or ".", exist_ok=True)
+        _text_index = PdfTextIndex(PDF_INDEX_PATH)
+    return _text_index
+
+def _index_owner(create: bool = False) -> Optional[str]:
+    """This browser's key in the search index, kept in the session cookie."""
+    owner = session.get("index_owner")
+    if owner is None and create:
+        owner = session["index_owner"] = secrets.token_urlsafe(16)
+        session.permanent = True
+    return owner
+
+def _extract_pages(path: str, start: int, stop: int) -> List[str]:
+    # Runs in a worker process: open the PDF from disk and read only [start, stop)
+    with fitz.open(path) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+def _iter_page_texts(path: str, page_count: int) -> Iterator[str]:
+    ranges = [(start, min(start + EXTRACT_CHUNK_PAGES, page_count))
+              for start in range(0, page_count, EXTRACT_CHUNK_PAGES)]
+    if len(ranges) <= 1 or EXTRACT_WORKERS <= 1:
+        for start, stop in ranges:
+            yield from _extract_pages(path, start, stop)
+        return
+    # map() yields chunk results in page order while later chunks are still running
+    starts = [start for start, _ in ranges]
+    stops = [stop for _, stop in ranges]
+    for texts in _get_extract_pool().map(_extract_pages, [path] * len(ranges), starts, stops):
+        yield from texts
+
+def _format_page(fmt: str, page_no: int, text: str) -> str:
+    if fmt == "ndjson":
+        return json.dumps({"page": page_no, "text": text}) + "\n"
+    return text + "\f"
+
+@app.post("/extract-text")
+def extract_text():
+    with stage("upload", bytes=request.content_length or 0):
+        f = request.files.get("pdf")
+    if not f:
+        flash("No PDF uploaded.")
+        return redirect(url_for("index"))
+    with stage("validate"):
+        name = secure_filename(f.filename or "")
+        if not _ext_ok(name, ALLOWED_PDF):
+            flash("Please upload a .pdf file.")
+            return redirect(url_for("index"))
+
+    fmt = "ndjson" if (request.form.get("format") or "").lower() == "ndjson" else "text"
+    add_to_index = request.form.get("index") in ("1", "on", "true")
+    owner = _index_owner(create=True) if add_to_index else None
+    with stage("read") as s:
+        data = f.read()
+        s.count(bytes=len(data))
+    with stage("hash", bytes=len(data)):
+        doc_id = hashlib.sha256(data).hexdigest()
+    headers = {
+        "X-Document-Id": doc_id,
+        "Content-Disposition": f"attachment; filename={name.rsplit('.', 1)[0]}.{'ndjson' if fmt == 'ndjson' else 'txt'}",
+    }
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/plain"
+
+    # Already indexed: serve the stored pages, no parsing at all
+    with stage("index-lookup"):
+        indexed = os.path.exists(PDF_INDEX_PATH) and _get_text_index().has(doc_id)
+    if indexed:
+        if owner is not None:
+            _get_text_index().add(doc_id, name, owner)
+        pages = _get_text_index().pages(doc_id)
+        return Response((_format_page(fmt, n, text) for n, text in pages), mimetype=mimetype, headers=headers)
+
+    # Workers open the file by path, so the upload is never pickled to them
+    with stage("spool", bytes=len(data)):
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+    del data
+    try:
+        with stage("pdf-parse") as s, fitz.open(path) as doc:
+            page_count = len(doc)
+            s.count(pages=page_count)
+    except Exception:
+        os.unlink(path)
+        flash("Could not read that PDF.")
+        return redirect(url_for("index"))
+    limited = charge(1 + page_count / 10)
+    if limited is not None:
+        os.unlink(path)
+        return limited
+
+    timings = current_timings()
+
+    def generate():
+        collected = [] if add_to_index else None
+        pages = _iter_page_texts(path, page_count)
+        try:
+            for page_no in range(1, page_count + 1):
+                # Time waiting on the workers, not on the client reading the stream
+                with timings.stage("extract", pages=1) as s:
+                    text = next(pages)
+                    s.count(chars=len(text))
+                if collected is not None:
+                    collected.append(text)
+                yield _format_page(fmt, page_no, text)
+            if collected is not None:
+                with timings.stage("index", pages=len(collected)):
+                    _get_text_index().add(doc_id, name, owner, collected)
+        finally:
+            os.unlink(path)
+
+    return Response(generate(), mimetype=mimetype, headers=headers)
+
+@app.get("/search")
+def search():
+    """Search the PDFs this session indexed, or only the ``doc`` ids given
+    (the X-Document-Id of an extraction), for clients without the cookie."""
+    query = (request.args.get("q") or "").strip()
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    doc_ids = request.args.getlist("doc")[:MAX_SEARCH_DOCS]
+    if not query:
+        return jsonify({"error": "Missing q"}), 400
+    if not os.path.exists(PDF_INDEX_PATH):
+        return jsonify({"query": query, "hits": []})
+    try:
+        with stage("search") as s:
+            hits = _get_text_index().search(query, _index_owner(), doc_ids, limit)
+            s.count(hits=len(hits))
+    except SearchQueryError as e:
+        return jsonify({"error": f"Invalid search query: {e}"}), 400
+    return jsonify({"query": query, "hits": hits})
+
+# ASGI entry point: uvicorn app:asgi_app (see asgi.py)
+asgi_app = AsgiBridge(app)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "8080"))
@@ -0,0 +1,190 @@
+"""The PDFs inside an uploaded ZIP or TAR, one member at a time.
+
+``iter_members()`` lists an archive's regular files and hands each one
+out with a ``read()`` that decompresses it on demand, so a merge holds at
+most one member in memory: read it, append its pages, drop it, move on.
+
+Orders:
+  name     natural sort on the member path (``2.pdf`` before ``10.pdf``)
+  archive  the order the members are stored in
+
+ZIPs are read through their central directory, so either order is random
+access. Plain TARs are seeked; a compressed TAR is streamed as is in
+archive order, and in name order it is first decompressed once to a
+temporary file, since seeking backwards in a compressed stream would
+decompress it again from the start for every member.
+
+Decompressed bytes are capped per archive (``max_bytes``) and so is the
+member count, so a small upload cannot expand without bound.
+"""
+import bz2
+import gzip
+import lzma
+import re
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from collections import namedtuple
+from typing import Iterator
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ORDERS = ("name", "archive")
+COPY_BUFFER = 1024 * 1024
+
+# (magic, opener) for the compressions tarfile's "r:*" mode understands
+_TAR_COMPRESSIONS = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+)
+
+# ``read()`` returns the member's bytes or raises MemberError / ArchiveError
+Member = namedtuple("Member", "name size read")
+
+
+class ArchiveError(Exception):
+    """The archive as a whole is unreadable or over its limits."""
+
+
+class MemberError(Exception):
+    """One member could not be read; the others may still be fine."""
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def natural_key(name: str):
+    # Digit runs compare as numbers; split() alternates text and digits,
+    # so equal positions always hold the same type
+    return [int(part) if i % 2 else part for i, part in enumerate(re.split(r"(\d+)", name.lower()))]
+
+
+def _ignored(name: str) -> bool:
+    # macOS resource forks and other hidden files ride along in many archives
+    parts = name.split("/")
+    return parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts if part)
+
+
+class _Budget:
+    def __init__(self, max_bytes: int):
+        self.remaining = max_bytes
+
+    def read(self, fileobj) -> bytes:
+        data = fileobj.read(self.remaining + 1)
+        if len(data) > self.remaining:
+            raise ArchiveError("The archive expands to more than the allowed size")
+        self.remaining -= len(data)
+        return data
+
+
+def iter_members(stream, filename: str, order: str = "name", max_members: int = 5000,
+                 max_bytes: int = 200 * 1024 * 1024) -> Iterator[Member]:
+    """Yield the regular files in the archive ``stream`` (a seekable binary file)."""
+    if order not in ORDERS:
+        raise ValueError(f"Unknown member order: {order}")
+    budget = _Budget(max_bytes)
+    if filename.lower().endswith(".zip"):
+        yield from _zip_members(stream, order, max_members, budget)
+    else:
+        yield from _tar_members(stream, order, max_members, budget)
+
+
+def _zip_members(stream, order, max_members, budget):
+    try:
+        archive = zipfile.ZipFile(stream)
+    except (zipfile.BadZipFile, OSError):
+        raise ArchiveError("Could not read the ZIP archive") from None
+    with archive:
+        infos = [info for info in archive.infolist() if not info.is_dir() and not _ignored(info.filename)]
+        if len(infos) > max_members:
+            raise ArchiveError(f"The archive has more than {max_members} files")
+        if order == "name":
+            infos.sort(key=lambda info: natural_key(info.filename))
+
+        def reader(info):
+            def read():
+                try:
+                    with archive.open(info) as member:
+                        return budget.read(member)
+                except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError) as e:
+                    # Corrupt data, a bad CRC, encryption or an unsupported method
+                    raise MemberError(str(e) or "unreadable") from None
+            return read
+
+        for info in infos:
+            yield Member(info.filename, info.file_size, reader(info))
+
+
+def _tar_members(stream, order, max_members, budget):
+    head = stream.read(6)
+    stream.seek(0)
+    opener = next((opener for magic, opener in _TAR_COMPRESSIONS if head.startswith(magic)), None)
+    try:
+        if opener is not None and order == "archive":
+            # Streamed: each member is decompressed as it is reached
+            with tarfile.open(fileobj=stream, mode="r|*") as archive:
+                yield from _tar_stream(archive, max_members, budget)
+            return
+        if opener is None:
+            with tarfile.open(fileobj=stream, mode="r:") as archive:
+                yield from _tar_seekable(archive, order, max_members, budget)
+            return
+        with tempfile.TemporaryFile() as plain:
+            with opener(stream) as compressed:
+                _copy_limited(compressed, plain, budget.remaining)
+            plain.seek(0)
+            with tarfile.open(fileobj=plain, mode="r:") as archive:
+                yield from _tar_seekable(archive, order, max_members, budget)
+    except (tarfile.TarError, EOFError, OSError, zlib.error, lzma.LZMAError) as e:
+        raise ArchiveError(f"Could not read the TAR archive ({e})") from None
+
+
+def _copy_limited(source, target, limit):
+    copied = 0
+    while True:
+        chunk = source.read(COPY_BUFFER)
+        if not chunk:
+            return
+        copied += len(chunk)
+        if copied > limit:
+            raise ArchiveError("The archive expands to more than the allowed size")
+        target.write(chunk)
+
+
+def _tar_reader(archive, info, budget):
+    def read():
+        try:
+            member = archive.extractfile(info)
+            if member is None:
+                raise MemberError("not a regular file")
+            with member:
+                return budget.read(member)
+        except (tarfile.TarError, EOFError, OSError, zlib.error, lzma.LZMAError) as e:
+            # Truncated or corrupt data; in a stream, later members fail too
+            raise MemberError(str(e) or "unreadable") from None
+    return read
+
+
+def _tar_stream(archive, max_members, budget):
+    count = 0
+    for info in archive:
+        if not info.isfile() or _ignored(info.name):
+            continue
+        count += 1
+        if count > max_members:
+            raise ArchiveError(f"The archive has more than {max_members} files")
+        # Valid only until the next member: the stream cannot go back
+        yield Member(info.name, info.size, _tar_reader(archive, info, budget))
+
+
+def _tar_seekable(archive, order, max_members, budget):
+    # getmembers() reads headers only, seeking over the data in between
+    infos = [info for info in archive.getmembers() if info.isfile() and not _ignored(info.name)]
+    if len(infos) > max_members:
+        raise ArchiveError(f"The archive has more than {max_members} files")
+    if order == "name":
+        infos.sort(key=lambda info: natural_key(info.name))
+    for info in infos:
+        yield Member(info.name, info.size, _tar_reader(archive, info, budget))
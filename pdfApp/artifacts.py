@@ -0,0 +1,143 @@
+"""Short-lived, resumable download artifacts for pdfApp results.
+
+Every generated PDF or ZIP is written to ``ARTIFACT_DIR`` under a random
+ID and served from disk, so a dropped download can be resumed -- or split
+into parallel ranges -- with ``GET /artifacts/<id>`` and ``Range`` /
+``If-Range`` instead of re-running the job. Artifacts expire after
+``ARTIFACT_TTL`` seconds; expired and abandoned files are swept out at
+most once a minute, from whichever worker happens to save next.
+
+The directory is the only shared state, so every worker process on the
+host sees the same artifacts.
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+Artifact = namedtuple("Artifact", "id path filename mimetype size expires")
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{22}$")
+_TMP_PREFIX = ".tmp-"
+CLEANUP_INTERVAL = 60
+
+
+class ArtifactWriter:
+    """File-like sink for one artifact; nothing is visible until ``commit()``."""
+
+    def __init__(self, store, filename, mimetype):
+        self.store = store
+        self.id = secrets.token_urlsafe(16)
+        self.filename = filename
+        self.mimetype = mimetype
+        self._tmp_path = os.path.join(store.directory, f"{_TMP_PREFIX}{self.id}")
+        self._file = open(self._tmp_path, "w+b")
+
+    # zipfile needs a seekable file; these make the writer one
+    def write(self, data):
+        return self._file.write(data)
+
+    def tell(self):
+        return self._file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        self._file.flush()
+
+    def commit(self):
+        size = self._file.seek(0, os.SEEK_END)
+        self._file.close()
+        expires = time.time() + self.store.ttl
+        meta = {"filename": self.filename, "mimetype": self.mimetype, "size": size, "expires": expires}
+        with open(self.store._meta_path(self.id), "w") as fh:
+            json.dump(meta, fh)
+        os.replace(self._tmp_path, self.store._data_path(self.id))
+        return Artifact(self.id, self.store._data_path(self.id), self.filename, self.mimetype, size, expires)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class ArtifactStore:
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def _data_path(self, artifact_id):
+        return os.path.join(self.directory, f"{artifact_id}.bin")
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self.directory, f"{artifact_id}.json")
+
+    def create(self, filename, mimetype):
+        self._maybe_cleanup()
+        return ArtifactWriter(self, filename, mimetype)
+
+    def save(self, data, filename, mimetype):
+        writer = self.create(filename, mimetype)
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def get(self, artifact_id):
+        """The artifact, or ``None`` if the ID is unknown, malformed or expired."""
+        if not _VALID_ID.match(artifact_id):
+            return None
+        try:
+            with open(self._meta_path(artifact_id)) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        path = self._data_path(artifact_id)
+        if meta["expires"] < time.time() or not os.path.exists(path):
+            return None
+        return Artifact(artifact_id, path, meta["filename"], meta["mimetype"], meta["size"], meta["expires"])
+
+    def _maybe_cleanup(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+        self.cleanup(now)
+
+    def cleanup(self, now=None):
+        """Delete expired artifacts and writes abandoned for longer than the TTL."""
+        now = now or time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.startswith(_TMP_PREFIX):
+                    if entry.stat().st_mtime < now - self.ttl:
+                        os.unlink(entry.path)
+                elif entry.name.endswith(".json"):
+                    with open(entry.path) as fh:
+                        expires = json.load(fh)["expires"]
+                    if expires < now:
+                        # Data first: a .bin without metadata is never served
+                        artifact_id = entry.name[:-len(".json")]
+                        for path in (self._data_path(artifact_id), entry.path):
+                            try:
+                                os.unlink(path)
+                            except FileNotFoundError:
+                                pass
+            except (OSError, ValueError, KeyError):
+                # Another worker got there first, or a half-written file
+                continue
@@ -17,4 +17,5 @@ COPY . .
 ENV PORT=8080
 EXPOSE 8080
 
-CMD ["python", "app.py"]
\ No newline at end of file
+# ASGI entry point; WEB_CONCURRENCY sets the worker process count
+CMD ["sh", "-c", "exec uvicorn app:asgi_app --host 0.0.0.0 --port ${PORT}"]
\ No newline at end of file
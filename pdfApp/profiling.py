@@ -0,0 +1,101 @@
+"""Opt-in per-request profiling.
+
+A request is profiled with cProfile when either
+
+* it carries ``X-Profile: <PROFILE_TOKEN>`` (admin-only: the token is a
+  server secret, and the saved file name is echoed in ``X-Profile-File``), or
+* it is picked by random sampling at ``PROFILE_SAMPLE_RATE`` (0 disables).
+
+Both paths share a ``PROFILE_MAX_PER_MINUTE`` cap per process, so
+profiling overhead never spreads to normal traffic. Profiles are written
+to ``PROFILE_DIR`` as ``.prof`` files for ``python -m pstats`` or snakeviz.
+
+pdfApp and textEditorApp each ship an identical copy of this file, since
+they are built and deployed separately; change both together. Call
+``init_profiling(app)`` right after creating the app.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import current_app, g, request
+
+PROFILE_HEADER = "X-Profile"
+
+_recent = deque()
+_recent_lock = threading.Lock()
+
+
+def init_profiling(app):
+    app.config.setdefault("PROFILE_TOKEN", os.environ.get("PROFILE_TOKEN"))
+    app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.environ.get("PROFILE_SAMPLE_RATE", "0")))
+    app.config.setdefault("PROFILE_MAX_PER_MINUTE", int(os.environ.get("PROFILE_MAX_PER_MINUTE", "6")))
+    app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR", os.path.join(app.instance_path, "profiles")))
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
+
+
+def _requested_by_admin():
+    token = current_app.config["PROFILE_TOKEN"]
+    sent = request.headers.get(PROFILE_HEADER)
+    return bool(token and sent) and hmac.compare_digest(sent.encode(), token.encode())
+
+
+def _within_rate_limit():
+    now = time.monotonic()
+    with _recent_lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if len(_recent) >= current_app.config["PROFILE_MAX_PER_MINUTE"]:
+            return False
+        _recent.append(now)
+        return True
+
+
+def _start_profile():
+    admin = _requested_by_admin()
+    sampled = not admin and random.random() < current_app.config["PROFILE_SAMPLE_RATE"]
+    if not (admin or sampled) or not _within_rate_limit():
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler already owns this interpreter
+        return
+    g._profiler = profiler
+    g._profile_admin = admin
+
+
+def _save(profiler):
+    profiler.disable()
+    directory = current_app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    endpoint = (request.endpoint or "unknown").replace(".", "-")
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}.prof"
+    profiler.dump_stats(os.path.join(directory, name))
+    logging.info("Saved profile %s for %s %s", name, request.method, request.path)
+    return name
+
+
+def _finish_profile(response):
+    profiler = g.pop("_profiler", None)
+    if profiler is not None:
+        name = _save(profiler)
+        if g.pop("_profile_admin", False):
+            response.headers["X-Profile-File"] = name
+    return response
+
+
+def _abandon_profile(exc):
+    # Unhandled exceptions skip after_request; still keep what we measured
+    profiler = g.pop("_profiler", None)
+    if profiler is not None:
+        _save(profiler)
@@ -0,0 +1,164 @@
+"""Per-client token-bucket rate limiting, charged by request cost.
+
+Each client (logged-in user id, else remote address) has a bucket of
+``RATELIMIT_BURST`` tokens refilled at ``RATELIMIT_RATE`` tokens/second.
+Requests are charged an estimated cost -- input bytes, pages x DPI --
+rather than 1 per request, so one huge job weighs as much as many small
+ones. An empty bucket gets a 429 with ``Retry-After``.
+
+Behind a reverse proxy the remote address is the proxy's, which would put
+every anonymous client in one bucket; both apps apply ``ProxyFix`` for
+``TRUSTED_PROXY_HOPS`` hops so it is the client's own.
+
+State lives in process memory by default. Set ``RATELIMIT_STORE`` to a
+SQLite file path to share buckets between all workers on the host.
+
+pdfApp and textEditorApp each ship an identical copy of this file, since
+they are built and deployed separately; change both together. Call
+``init_rate_limiting(app)`` once, then use ``@rate_limited(cost_func)`` or
+``charge(cost)`` inside a view when the cost is only known mid-request.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+try:
+    from flask_login import current_user
+except ImportError:  # pdfApp has no user accounts
+    current_user = None
+
+
+def _take(tokens, updated, now, cost, rate, capacity):
+    """Refill a bucket to ``now`` and try to take ``cost`` tokens.
+
+    Returns ``(tokens_left, seconds_to_wait)``; the wait is 0 on success.
+    Costs above the bucket size are clamped so big jobs can still run,
+    they just empty the bucket.
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    cost = min(cost, capacity)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Buckets for this process only."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, cost, rate, capacity):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = _take(tokens, updated, now, cost, rate, capacity)
+            self._buckets[key] = (tokens, now)
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                # Buckets idle long enough to be full again carry no state
+                idle = capacity / rate
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < idle}
+        return wait
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        conn = sqlite3.connect(self.path, timeout=5)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                         "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        conn.close()
+
+    def _connect(self):
+        # One connection per thread, and never one inherited across fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, cost, rate, capacity):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = _take(tokens, updated, now, cost, rate, capacity)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - capacity / rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def init_rate_limiting(app):
+    app.config.setdefault("RATELIMIT_ENABLED", os.environ.get("RATELIMIT_ENABLED", "1") == "1")
+    app.config.setdefault("RATELIMIT_RATE", float(os.environ.get("RATELIMIT_RATE", "10")))
+    app.config.setdefault("RATELIMIT_BURST", float(os.environ.get("RATELIMIT_BURST", "100")))
+    app.config.setdefault("RATELIMIT_STORE", os.environ.get("RATELIMIT_STORE", ""))
+    path = app.config["RATELIMIT_STORE"]
+    app.extensions["ratelimit"] = SQLiteBucketStore(path) if path else MemoryBucketStore()
+
+
+def client_key():
+    if (current_user is not None and hasattr(current_app, "login_manager")
+            and current_user.is_authenticated):
+        return f"user:{current_user.get_id()}"
+    return f"ip:{request.remote_addr}"
+
+
+def charge(cost):
+    """Charge ``cost`` tokens to the current client.
+
+    Returns ``None`` if allowed, otherwise a 429 response to return.
+    """
+    config = current_app.config
+    if not config["RATELIMIT_ENABLED"]:
+        return None
+    wait = current_app.extensions["ratelimit"].take(
+        client_key(), cost, config["RATELIMIT_RATE"], config["RATELIMIT_BURST"])
+    if not wait:
+        return None
+    retry_after = max(1, math.ceil(wait))
+    body = json.dumps({"error": "Rate limit exceeded, please retry later", "retry_after": retry_after})
+    response = current_app.response_class(body, status=429, mimetype="application/json")
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def rate_limited(cost_func):
+    """Charge ``cost_func()`` tokens before running the view."""
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limited = charge(cost_func())
+            if limited is not None:
+                return limited
+            return f(*args, **kwargs)
+        return decorated_function
+
+    return decorator
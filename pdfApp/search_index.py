@@ -0,0 +1,100 @@
+"""Local full-text index over extracted PDF pages (SQLite FTS5).
+
+Documents are keyed by the SHA-256 of their bytes, so uploading the same
+file again is recognised and its pages come straight from the index
+instead of being re-parsed.
+
+Each document is searchable only by its owners -- whoever indexed it,
+under the filename they gave it -- or by a search that names its id. Two
+owners of the same file share its pages but not each other's documents.
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(doc_id UNINDEXED, page UNINDEXED, body);
+CREATE TABLE IF NOT EXISTS owners (
+    doc_id TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    PRIMARY KEY (owner, doc_id)
+);
+"""
+
+
+class SearchQueryError(ValueError):
+    """The search string is not valid FTS5 query syntax."""
+
+
+class PdfTextIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Short-lived connections: safe across threads and forked workers
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def has(self, doc_id: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone() is not None
+
+    def pages(self, doc_id: str) -> Iterator[Tuple[int, str]]:
+        with self._connect() as conn:
+            yield from conn.execute(
+                "SELECT page, body FROM pages WHERE doc_id = ? ORDER BY page", (doc_id,))
+
+    def add(self, doc_id: str, filename: str, owner: str, page_texts: Optional[List[str]] = None) -> None:
+        """Index ``page_texts`` unless the document already is, and make
+        ``owner`` one of its owners; ``page_texts`` may be omitted then."""
+        with self._connect() as conn:
+            if not conn.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone():
+                if page_texts is None:
+                    raise KeyError(doc_id)
+                conn.execute("INSERT INTO documents (id, filename, page_count, indexed_at) VALUES (?, ?, ?, ?)",
+                             (doc_id, filename, len(page_texts), time.time()))
+                conn.executemany("INSERT INTO pages (doc_id, page, body) VALUES (?, ?, ?)",
+                                 ((doc_id, i, text) for i, text in enumerate(page_texts, start=1)))
+            conn.execute("INSERT OR REPLACE INTO owners (doc_id, owner, filename) VALUES (?, ?, ?)",
+                         (doc_id, owner, filename))
+
+    def search(self, query: str, owner: Optional[str] = None, doc_ids: Sequence[str] = (),
+               limit: int = 20) -> List[dict]:
+        """Hits in ``owner``'s documents, or only in ``doc_ids`` when given."""
+        if doc_ids:
+            scope = f"pages.doc_id IN ({', '.join('?' * len(doc_ids))})"
+            params = list(doc_ids)
+        elif owner:
+            scope = "pages.doc_id IN (SELECT doc_id FROM owners WHERE owner = ?)"
+            params = [owner]
+        else:
+            return []
+        # Only the caller's own name for the file; None when searched by id
+        sql = f"""
+            SELECT pages.doc_id, owners.filename, pages.page, snippet(pages, 2, '[', ']', '…', 12)
+            FROM pages LEFT JOIN owners ON owners.doc_id = pages.doc_id AND owners.owner = ?
+            WHERE pages MATCH ? AND {scope} ORDER BY rank LIMIT ?
+        """
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(sql, [owner or "", query, *params, limit]).fetchall()
+        except sqlite3.OperationalError as e:
+            raise SearchQueryError(str(e)) from None
+        return [{"document": doc_id, "filename": filename, "page": page, "snippet": snippet}
+                for doc_id, filename, page, snippet in rows]
@@ -0,0 +1,221 @@
+"""Stamp or watermark every page of a PDF with shared form XObjects.
+
+Each stamp -- a line of text or an uploaded image -- is drawn once into a
+form XObject, and every page only references it: the per-page cost is a
+few resource-dictionary entries plus a content stream that is itself
+shared by all pages with the same geometry (MediaBox, CropBox, rotation).
+Stamping a 1000-page bundle therefore adds roughly what stamping one page
+does, and the pages are visited exactly once.
+
+Positions:
+  diagonal    corner to corner across the middle, as large as fits
+  center      horizontal across the middle, as large as fits
+  top/bottom  natural size (shrunk to fit the width) inside the margin
+
+Stamps are placed in the page's visible orientation, so rotated pages get
+upright stamps. ``layer="under"`` draws them beneath the page content.
+"""
+import io
+import math
+from collections import namedtuple
+from typing import List, Sequence
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+POSITIONS = ("diagonal", "center", "top", "bottom")
+LAYERS = ("over", "under")
+# Text is set at this size and scaled per page; vector glyphs stay sharp
+FIT_FONT_SIZE = 72
+EDGE_FONT_SIZE = 10
+EDGE_MARGIN = 24
+# Share of the page a diagonal/center stamp may span
+FIT_FRACTION = 0.8
+# top/bottom images are at most this share of the page height
+EDGE_IMAGE_FRACTION = 0.1
+
+# ``source`` is a one-page document holding the artwork at its natural size
+Stamp = namedtuple("Stamp", "source position opacity")
+
+
+def text_stamp(text: str, position: str = "diagonal", color=(0.5, 0.5, 0.5), opacity: float = 1.0,
+               fontsize: float = None) -> Stamp:
+    if position not in POSITIONS:
+        raise ValueError(f"Unknown stamp position: {position}")
+    text = text.strip()
+    if not text:
+        raise ValueError("Stamp text is empty")
+    fontsize = fontsize or (EDGE_FONT_SIZE if position in ("top", "bottom") else FIT_FONT_SIZE)
+    # Base-14 Helvetica: nothing is embedded, so the stamp costs a few hundred bytes
+    width = fitz.get_text_length(text, fontname="helv", fontsize=fontsize)
+    height = fontsize * 1.2
+    source = fitz.open()
+    page = source.new_page(width=width, height=height)
+    page.insert_text((0, fontsize * 0.95), text, fontname="helv", fontsize=fontsize, color=color)
+    return Stamp(source, position, opacity)
+
+
+def image_stamp(data: bytes, position: str = "diagonal", opacity: float = 1.0) -> Stamp:
+    """A stamp from PNG/JPEG/... bytes; transparency in the image is kept."""
+    if position not in POSITIONS:
+        raise ValueError(f"Unknown stamp position: {position}")
+    with Image.open(io.BytesIO(data)) as img:  # raises on unreadable images
+        size = img.size
+        if img.format not in ("PNG", "JPEG"):
+            # Anything else is re-encoded once, keeping transparency
+            buf = io.BytesIO()
+            img.save(buf, "PNG")
+            data = buf.getvalue()
+    source = fitz.open()
+    page = source.new_page(width=size[0], height=size[1])
+    page.insert_image(page.rect, stream=data)
+    return Stamp(source, position, opacity)
+
+
+def stamp_pdf(data: bytes, stamps: Sequence[Stamp], layer: str = "over") -> bytes:
+    """Return ``data`` with every stamp on every page."""
+    if layer not in LAYERS:
+        raise ValueError(f"Unknown stamp layer: {layer}")
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        forms = [_add_form(doc, stamp) for stamp in stamps]
+        states = {}
+        for stamp in stamps:
+            if stamp.opacity not in states:
+                states[stamp.opacity] = _add_object(
+                    doc, f"<< /Type /ExtGState /ca {stamp.opacity:g} /CA {stamp.opacity:g} >>")
+
+        # Page geometry is read for all pages before anything is written:
+        # MuPDF's page-number lookups get slow once the document is modified
+        operators = {}  # (MediaBox, CropBox, rotation) -> content stream
+        pages = []
+        for page in doc:
+            key = (tuple(page.mediabox), tuple(page.cropbox), page.rotation)
+            if key not in operators:
+                ops = ["Q"] if layer == "over" else []
+                for stamp, (form, width, height) in zip(stamps, forms):
+                    m = _placement(page, width, height, stamp.position)
+                    ops.append(f"q /S{states[stamp.opacity]} gs {m.a:g} {m.b:g} {m.c:g} {m.d:g} {m.e:g} {m.f:g} cm "
+                               f"/X{form} Do Q")
+                operators[key] = ("\n".join(ops) + "\n").encode()
+            pages.append((page.xref, key))
+
+        # One content stream per geometry, shared by every page that has it.
+        # Overlays go after a saved state, so whatever graphics state the page
+        # content leaves behind is restored before the stamps are drawn.
+        streams = {key: _add_object(doc, "<< >>", ops) for key, ops in operators.items()}
+        save = _add_object(doc, "<< >>", b"q\n") if layer == "over" else None
+        xobjects = {f"X{form}": form for form, _, _ in forms}
+        ext_states = {f"S{state}": state for state in states.values()}
+        updated = set()
+        for xref, key in pages:
+            _add_resources(doc, xref, "XObject", xobjects, updated)
+            _add_resources(doc, xref, "ExtGState", ext_states, updated)
+            _add_contents(doc, xref, streams[key], save)
+        # garbage=1 drops the temporary page the stamp artwork was copied in with
+        return doc.tobytes(garbage=1, deflate=True)
+
+
+def _add_object(doc, dictionary: str, stream: bytes = None) -> int:
+    xref = doc.get_new_xref()
+    doc.update_object(xref, dictionary)
+    if stream is not None:
+        doc.update_stream(xref, stream)
+    return xref
+
+
+def _add_form(doc, stamp: Stamp):
+    """Copy the stamp's artwork into ``doc`` as a form XObject; ``(xref, width, height)``."""
+    # insert_pdf brings along fonts, images and transparency groups it uses
+    doc.insert_pdf(stamp.source)
+    page = doc[-1]
+    width, height = page.rect.width, page.rect.height
+    kind, resources = doc.xref_get_key(page.xref, "Resources")
+    if kind == "null":
+        resources = "<< >>"
+    form = _add_object(
+        doc,
+        f"<< /Type /XObject /Subtype /Form /BBox [0 0 {width:g} {height:g}] /Resources {resources} >>",
+        page.read_contents())
+    doc.delete_page(-1)
+    return form, width, height
+
+
+def _placement(page, width: float, height: float, position: str) -> fitz.Matrix:
+    """Matrix taking the form's space onto the page's PDF space at ``position``."""
+    visible = page.rect
+    angle = 0.0
+    if position == "diagonal":
+        angle = math.degrees(math.atan2(visible.height, visible.width))
+    if position in ("diagonal", "center"):
+        cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        scale = FIT_FRACTION * min(visible.width / (width * cos + height * sin),
+                                   visible.height / (width * sin + height * cos))
+        center = (visible.width / 2, visible.height / 2)
+    else:
+        scale = min(1.0, (visible.width - 2 * EDGE_MARGIN) / width)
+        if height > EDGE_FONT_SIZE * 2:
+            scale = min(scale, EDGE_IMAGE_FRACTION * visible.height / height)
+        offset = EDGE_MARGIN + height * scale / 2
+        center = (visible.width / 2, offset if position == "top" else visible.height - offset)
+    # Form space is y-up around its own box; visible space is y-down.
+    # A negative angle turns counter-clockwise as the reader sees it.
+    m = fitz.Matrix(1, 0, 0, 1, -width / 2, -height / 2)
+    m *= fitz.Matrix(scale, -scale)
+    m *= fitz.Matrix(-angle)
+    m *= fitz.Matrix(1, 0, 0, 1, *center)
+    # visible -> unrotated MuPDF space (y-down from the CropBox corner) -> PDF
+    # user space. page.transformation_matrix drops the CropBox offset on
+    # rotated pages, so the last step comes from the boxes themselves.
+    crop, media = page.cropbox, page.mediabox
+    return m * page.derotation_matrix * fitz.Matrix(1, 0, 0, -1, crop.x0, media.y1 - crop.y0)
+
+
+def _resolve_resources(doc, page_xref: int):
+    """``(xref, key prefix)`` of the page's /Resources, made local to the page if inherited."""
+    kind, value = doc.xref_get_key(page_xref, "Resources")
+    parent = page_xref
+    while kind == "null":
+        kind, value = doc.xref_get_key(parent, "Parent")
+        if kind != "xref":
+            value, kind = "<< >>", "dict"
+            break
+        parent = int(value.split()[0])
+        kind, value = doc.xref_get_key(parent, "Resources")
+    if parent != page_xref:
+        # Inherited: give the page its own entry so the stamp can be added
+        doc.xref_set_key(page_xref, "Resources", value)
+    if kind == "xref":
+        return int(value.split()[0]), ""
+    return page_xref, "Resources/"
+
+
+def _add_resources(doc, page_xref: int, category: str, entries: dict, updated: set) -> None:
+    """Add ``entries`` to the page's /Resources/<category>; ``updated`` holds
+    the indirect dictionaries already done, since pages often share one."""
+    holder, prefix = _resolve_resources(doc, page_xref)
+    kind, value = doc.xref_get_key(holder, prefix + category)
+    if kind == "xref":
+        holder, prefix = int(value.split()[0]), ""
+    else:
+        prefix += category + "/"
+    if holder != page_xref:
+        if (holder, prefix) in updated:
+            return
+        updated.add((holder, prefix))
+    for name, xref in entries.items():
+        doc.xref_set_key(holder, prefix + name, f"{xref} 0 R")
+
+
+def _add_contents(doc, page_xref: int, stream: int, save: int = None) -> None:
+    kind, value = doc.xref_get_key(page_xref, "Contents")
+    if kind == "xref":
+        existing: List[str] = [value]
+    elif kind == "array":
+        existing = [value.strip()[1:-1].strip()]
+    else:
+        existing = []
+    if save is None:
+        parts = [f"{stream} 0 R"] + existing
+    else:
+        parts = [f"{save} 0 R"] + existing + [f"{stream} 0 R"]
+    doc.xref_set_key(page_xref, "Contents", "[" + " ".join(parts) + "]")
@@ -0,0 +1,60 @@
+"""/images-to-pdf with scanner-sized TIFFs: run with ``python -m pytest`` from pdfApp."""
+import io
+
+import fitz
+import pytest
+from PIL import Image, ImageDraw
+
+import app as pdf_app
+
+# A 600 DPI A3 scan
+A3_600DPI = (7016, 9921)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_app, "ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(pdf_app, "_artifact_store", None)
+    pdf_app.app.config["TESTING"] = True
+    return pdf_app.app.test_client()
+
+
+def _bitonal_tiff(size, frames=1):
+    pages = []
+    for n in range(frames):
+        page = Image.new("1", size, 1)
+        draw = ImageDraw.Draw(page)
+        for y in range(200, size[1] - 200, 400):
+            draw.text((200, y), f"page {n + 1} line {y}", fill=0)
+        pages.append(page)
+    buf = io.BytesIO()
+    pages[0].save(buf, format="TIFF", compression="group4", save_all=True, append_images=pages[1:])
+    buf.seek(0)
+    return buf
+
+
+def _convert(client, tiff, pagesize="auto"):
+    response = client.post("/images-to-pdf", data={"images": (tiff, "scan.tif"), "pagesize": pagesize},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200, response.headers.get("Location")
+    doc = fitz.open("pdf", response.get_data())
+    response.close()
+    return doc
+
+
+def test_a3_bitonal_scan_is_within_budget(client):
+    with Image.open(_bitonal_tiff(A3_600DPI)) as img:
+        assert pdf_app._decoded_bytes(img) < 9 * 1024 * 1024
+    doc = _convert(client, _bitonal_tiff(A3_600DPI))
+    assert doc.page_count == 1
+    assert (doc[0].rect.width, doc[0].rect.height) == A3_600DPI
+
+
+@pytest.mark.parametrize("pagesize", ["auto", "a4"])
+def test_frames_over_budget_are_placed_by_mupdf(client, monkeypatch, pagesize):
+    monkeypatch.setattr(pdf_app, "IMAGE_DECODE_BUDGET", 1024 * 1024)
+    doc = _convert(client, _bitonal_tiff(A3_600DPI, frames=2), pagesize)
+    assert doc.page_count == 2
+    expected = A3_600DPI if pagesize == "auto" else pdf_app.PAGE_SIZES["a4"]
+    assert (doc[1].rect.width, doc[1].rect.height) == expected
+    assert len(doc[1].get_images()) == 1
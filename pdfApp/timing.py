@@ -0,0 +1,149 @@
+"""Per-request stage timings: ``Server-Timing`` headers and structured logs.
+
+Views wrap their work in named stages, with counts for what each stage
+handled::
+
+    with stage("render", pages=1) as s:
+        pix = page.get_pixmap(...)
+        s.count(pixels=pix.width * pix.height)
+
+Entering the same stage again adds to its time and counts, so per-page
+work shows up as one ``render`` entry for the whole document.
+
+Every response carries ``X-Request-ID`` (the client's own when it sent
+one) and a ``Server-Timing`` header with one entry per stage plus
+``total``, so browser dev tools show the breakdown directly. Once the
+response has been sent -- for streamed bodies, after the last chunk -- one
+JSON line with the request id, status, per-stage milliseconds and counts,
+and the ``send`` time is logged to the ``pdfapp.timing`` logger. Stages
+that run inside a streamed body are only in that log line, because the
+headers are already gone by then; capture ``current_timings()`` before
+returning the generator and use its ``stage()`` inside.
+"""
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from werkzeug.wsgi import ClosingIterator
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+logger = logging.getLogger("pdfapp.timing")
+
+
+class _StageCounts:
+    def __init__(self, counts):
+        self._counts = counts
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self._counts[key] = self._counts.get(key, 0) + value
+
+
+class RequestTimings:
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages = {}  # name -> [milliseconds, counts]
+
+    @contextmanager
+    def stage(self, name, **counts):
+        entry = self.stages.setdefault(name, [0.0, {}])
+        counter = _StageCounts(entry[1])
+        counter.count(**counts)
+        start = time.perf_counter()
+        try:
+            yield counter
+        finally:
+            entry[0] += (time.perf_counter() - start) * 1000
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        parts = []
+        for name, (ms, counts) in self.stages.items():
+            part = f"{name};dur={ms:.1f}"
+            if counts:
+                part += ';desc="' + " ".join(f"{k}={v}" for k, v in counts.items()) + '"'
+            parts.append(part)
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+
+def init_timing(app):
+    # Registered first, so the timer wraps every other hook
+    app.before_request(_start_timing)
+    app.after_request(_finish_timing)
+
+
+def current_timings():
+    """The running request's timings; a throwaway instance outside requests."""
+    timings = g.get("_timings") if has_request_context() else None
+    return timings if timings is not None else RequestTimings("")
+
+
+def stage(name, **counts):
+    """Time a named stage of the current request (see module docstring)."""
+    return current_timings().stage(name, **counts)
+
+
+def _start_timing():
+    sent = request.headers.get(REQUEST_ID_HEADER, "")
+    g._timings = RequestTimings(sent if _VALID_REQUEST_ID.match(sent) else uuid.uuid4().hex)
+
+
+def _finish_timing(response):
+    timings = g.pop("_timings", None)
+    if timings is None:
+        return response
+    response.headers[REQUEST_ID_HEADER] = timings.request_id
+    response.headers["Server-Timing"] = timings.server_timing()
+    sending = time.perf_counter()
+    entry = {
+        "request_id": timings.request_id,
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "bytes_in": request.content_length or 0,
+        # None for streamed bodies
+        "bytes_out": response.content_length,
+    }
+
+    def log():
+        entry["send_ms"] = round((time.perf_counter() - sending) * 1000, 1)
+        entry["total_ms"] = round(timings.elapsed_ms(), 1)
+        entry["stages"] = {name: dict(counts, ms=round(ms, 1)) for name, (ms, counts) in timings.stages.items()}
+        logger.info(json.dumps(entry))
+
+    # Runs after the body has been sent, including every streamed chunk.
+    # send_file() bodies bypass Response.close(), so wrap those directly --
+    # except the server's own file wrapper, which must keep its type to be
+    # sendfile()d: the server calls its close() once the file is sent.
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if isinstance(file_wrapper, type) and isinstance(response.response, file_wrapper):
+        _log_on_close(response.response, log)
+    elif response.direct_passthrough:
+        response.response = ClosingIterator(response.response, log)
+    else:
+        response.call_on_close(log)
+    return response
+
+
+def _log_on_close(body, log):
+    close = getattr(body, "close", None)
+
+    def close_and_log():
+        try:
+            if close is not None:
+                close()
+        finally:
+            log()
+
+    body.close = close_and_log
@@ -1,36 +1,87 @@
+import os
+import logging
+
+import click
 from flask import Flask
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
-import os
 from werkzeug.middleware.proxy_fix import ProxyFix
-import logging
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from profiling import init_profiling
+from ratelimit import init_rate_limiting
+from regex_sandbox import init_regex_sandbox
+from transport import init_compression
+
 
 class Base(DeclarativeBase):
     pass
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1) # needed for url_for to generate with https
-
-# Database configuration
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
-}
-
-# No need to call db.init_app(app) here, it's already done in the constructor.
-db = SQLAlchemy(app, model_class=Base)
-
-# Create tables
-# Need to put this in module-level to make it work with Gunicorn.
-with app.app_context():
+
+# Bound to an app in create_app(). Engines are created lazily by
+# Flask-SQLAlchemy, so no connection is opened until a query actually runs.
+db = SQLAlchemy(model_class=Base)
+
+
+def create_app(test_config=None):
+    """Build and configure the Flask app.
+
+    Nothing here touches the database: schema management lives in the
+    ``flask init-db`` command so worker boots stay cheap.
+    """
+    app = Flask(__name__, template_folder="frontend")
+    app.secret_key = os.environ.get("SESSION_SECRET")
+    # Trust the router's X-Forwarded-* headers: url_for generates https, and
+    # remote_addr is the client (rate limiting keys on it). Set
+    # TRUSTED_PROXY_HOPS=0 when clients connect directly.
+    hops = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Database configuration
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        'pool_pre_ping': True,
+        "pool_recycle": 300,
+    }
+    # /api/batch limits; batches over BATCH_PARALLEL_MIN_CHARS use a process pool
+    app.config["BATCH_MAX_DOCUMENTS"] = int(os.environ.get("BATCH_MAX_DOCUMENTS", "10000"))
+    app.config["BATCH_WORKERS"] = int(os.environ.get("BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    app.config["BATCH_PARALLEL_MIN_CHARS"] = int(os.environ.get("BATCH_PARALLEL_MIN_CHARS", "1000000"))
+    # Responses smaller than this are sent uncompressed
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+    # Rate-limit cost: one token per request plus one per this many input bytes
+    app.config["RATELIMIT_BYTES_PER_TOKEN"] = int(os.environ.get("RATELIMIT_BYTES_PER_TOKEN", str(64 * 1024)))
+    # Flask-Login convention; when set, require_login lets every request through.
+    app.config["LOGIN_DISABLED"] = os.environ.get("LOGIN_DISABLED") == "1"
+
+    if test_config is not None:
+        app.config.update(test_config)
+
+    init_profiling(app)
+    db.init_app(app)
+    init_compression(app)
+    init_rate_limiting(app)
+    # Regex find-replace runs in killable worker processes (REGEX_TIMEOUT/REGEX_WORKERS)
+    init_regex_sandbox(app)
+
     import models  # noqa: F401
+    from replit_auth import login_manager, make_replit_blueprint
+    from routes import bp
+
+    login_manager.init_app(app)
+    if not app.config["LOGIN_DISABLED"]:
+        app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
+    app.register_blueprint(bp)
+
+    app.cli.add_command(init_db_command)
+    return app
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create database tables (run once per deploy, not per worker)."""
     db.create_all()
     logging.info("Database tables created")
-
+    click.echo("Database tables created")
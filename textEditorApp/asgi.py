@@ -0,0 +1,229 @@
+"""Serve the Flask app over ASGI without tying a worker to slow clients.
+
+Under plain WSGI a worker is busy for the whole request: a client trickling
+a 50 MB upload, or slowly downloading a big ZIP, blocks it as surely as a
+PDF render does. ``AsgiBridge`` splits the two kinds of waiting:
+
+* the request body is received on the event loop into a spooled temporary
+  file (memory up to ``ASGI_SPOOL_BYTES``, disk beyond), so an upload costs
+  a coroutine, not a thread;
+* the Flask app then runs in a bounded thread pool (``ASGI_THREADS``), and
+  so does producing each part of the response body -- rendering pages,
+  zipping, the text engine -- while sending that part to the client
+  happens back on the event loop, with the server's flow control.
+
+A few worker processes can therefore hold hundreds of slow connections
+while only ``ASGI_THREADS`` requests per process compute at a time. Work
+that already fans out to process pools (batch jobs, PDF text extraction)
+still does. Bodies over the app's ``MAX_CONTENT_LENGTH`` get a 413 before
+the app runs.
+
+pdfApp and textEditorApp each ship an identical copy of this file, since
+they are built and deployed separately; change both together. Serve with e.g.
+
+    uvicorn main:asgi_app --workers 4          # textEditorApp
+    uvicorn app:asgi_app --workers 4           # pdfApp
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Response parts are coalesced up to this size, or this long, per hop to the loop
+SEND_CHUNK_BYTES = 64 * 1024
+SEND_CHUNK_SECONDS = 0.05
+
+
+class AsgiBridge:
+    def __init__(self, wsgi_app, threads=None, spool_bytes=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads or int(os.environ.get("ASGI_THREADS", "8"))
+        self.spool_bytes = spool_bytes or int(os.environ.get("ASGI_SPOOL_BYTES", str(1024 * 1024)))
+        self._executor = None
+
+    def _get_executor(self):
+        # Created on first use, i.e. inside the serving process after any fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="asgi")
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                    self._executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _max_body(self):
+        config = getattr(self.wsgi_app, "config", None)
+        return config.get("MAX_CONTENT_LENGTH") if config is not None else None
+
+    async def _read_body(self, scope, receive):
+        """Spool the request body; ``(None, 413)`` if too large, ``(None, None)`` if the client left."""
+        max_body = self._max_body()
+        declared = _header(scope, b"content-length")
+        if max_body is not None and declared is not None and declared.isdigit() and int(declared) > max_body:
+            return None, 413
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None, None
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if max_body is not None and size > max_body:
+                body.close()
+                return None, 413
+            if chunk:
+                # Writes past spool_bytes hit disk; small enough not to matter for the loop
+                body.write(chunk)
+            if not message.get("more_body", False):
+                body.seek(0)
+                return body, None
+
+    async def _http(self, scope, receive, send):
+        body, error = await self._read_body(scope, receive)
+        if body is None:
+            if error == 413:
+                await _plain_response(send, 413, b"Request body too large")
+            return
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        app_iter = None
+        try:
+            try:
+                status, headers, app_iter, iterator, chunk, done = await loop.run_in_executor(
+                    executor, self._start, _environ(scope, body))
+            except Exception:
+                await _plain_response(send, 500, b"Internal Server Error")
+                raise
+            await send({
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            })
+            while True:
+                await send({"type": "http.response.body", "body": chunk, "more_body": not done})
+                if done or disconnected.is_set():
+                    break
+                chunk, done = await loop.run_in_executor(executor, _next_part, iterator)
+        finally:
+            watcher.cancel()
+            close = getattr(app_iter, "close", None)
+            if close is not None:
+                # Runs the app's teardown/on-close callbacks, e.g. timing logs
+                await loop.run_in_executor(executor, close)
+            body.close()
+
+    def _start(self, environ):
+        """Call the WSGI app and produce the first part of its body (in a pool thread)."""
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and "sent" in response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = status
+            response["headers"] = headers
+            return written.append
+
+        app_iter = self.wsgi_app(environ, start_response)
+        iterator = iter(app_iter)
+        # start_response may be deferred until the first chunk is produced
+        chunk, done = _next_part(iterator)
+        response["sent"] = True
+        return response["status"], response["headers"], app_iter, iterator, b"".join(written) + chunk, done
+
+
+def _next_part(iterator):
+    """Pull response chunks until there is enough to send; ``(bytes, done)``."""
+    parts = []
+    size = 0
+    started = time.monotonic()
+    for chunk in iterator:
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+        if size >= SEND_CHUNK_BYTES or (parts and time.monotonic() - started >= SEND_CHUNK_SECONDS):
+            return b"".join(parts), False
+    return b"".join(parts), True
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    body.seek(0, os.SEEK_END)
+    length = body.tell()
+    body.seek(0)
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        # The whole body is already here, whatever framing the client used
+        "CONTENT_LENGTH": str(length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for key, value in scope["headers"]:
+        name = key.decode("latin-1").upper().replace("-", "_")
+        if name in ("CONTENT_LENGTH", "TRANSFER_ENCODING"):
+            continue
+        if name != "CONTENT_TYPE":
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _plain_response(send, status, message):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(message)).encode())]})
+    await send({"type": "http.response.body", "body": message})
@@ -0,0 +1,174 @@
+"""Throughput and peak-memory benchmarks for the text operations.
+
+Each case runs every operation over every corpus kind and size twice:
+directly through ``text_engine`` and through the Flask test client (auth
+disabled, in-memory SQLite), so HTTP/JSON overhead is visible separately
+from the algorithm. Results are MB/s (UTF-8 input bytes over the best of
+several runs) and peak traced memory.
+
+    python benchmarks/bench_text.py                       # run, compare to baseline
+    python benchmarks/bench_text.py --sizes 1K,1M,50M --ops seo-analysis
+    python benchmarks/bench_text.py --update-baseline     # record a new baseline
+
+Exits non-zero when a case is slower, or uses more memory, than the
+baseline allows (``--tolerance``, default 30%).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import corpus  # noqa: E402
+import text_engine  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = "1K,64K,1M"
+MB = 1024 * 1024
+
+# (case label, operation, extra request fields)
+CASES = (
+    ("convert-case/title", "convert-case", {"case_type": "title"}),
+    ("convert-case/sentence", "convert-case", {"case_type": "sentence"}),
+    ("count-text", "count-text", {}),
+    ("find-replace/literal", "find-replace", {"find": "the", "replace": "THE"}),
+    ("find-replace/regex", "find-replace", {"find": r"\b(\w+)ing\b", "replace": r"\1ed", "use_regex": True}),
+    ("clean-text/all", "clean-text", {"clean_type": "all"}),
+    ("format-text/remove", "format-text", {"format_type": "remove_formatting"}),
+    ("seo-analysis", "seo-analysis", {"keyword": "product"}),
+    ("compare-text", "compare-text", {}),
+)
+
+
+def request_data(name, params, text):
+    if name == "compare-text":
+        return {"text1": text, "text2": text.upper()}
+    return dict(params, text=text)
+
+
+def best_time(func, min_time=0.2, max_runs=20):
+    """Best wall time of ``func()`` over repeated runs (at least one)."""
+    best = float("inf")
+    spent = 0.0
+    runs = 0
+    while runs < max_runs and (runs == 0 or spent < min_time):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        runs += 1
+    return best
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def make_client():
+    from app import create_app
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://", "SECRET_KEY": "bench",
+                      "LOGIN_DISABLED": True, "RATELIMIT_ENABLED": False, "TESTING": True})
+    return app.test_client()
+
+
+def measure(label, name, params, kind, size, text, client):
+    data = request_data(name, params, text)
+    nbytes = len(text.encode("utf-8"))
+
+    def direct():
+        text_engine.run(name, data)
+
+    def via_flask():
+        response = client.post(f"/api/{name}", json=data)
+        assert response.status_code == 200, (label, response.status_code)
+
+    results = []
+    for mode, func in (("direct", direct), ("flask", via_flask)):
+        seconds = best_time(func)
+        results.append({
+            "key": f"{label}|{kind}|{size}|{mode}",
+            "mb_per_s": round(nbytes / MB / seconds, 3),
+            "seconds": round(seconds, 6),
+            "peak_bytes": peak_memory(func),
+        })
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions against ``baseline``."""
+    failures = []
+    for row in results:
+        base = baseline.get(row["key"])
+        if base is None:
+            continue
+        if row["mb_per_s"] < base["mb_per_s"] * (1 - tolerance):
+            failures.append(f"{row['key']}: {row['mb_per_s']} MB/s < baseline {base['mb_per_s']} MB/s")
+        if row["peak_bytes"] > base["peak_bytes"] * (1 + tolerance) + 64 * 1024:
+            failures.append(f"{row['key']}: peak {row['peak_bytes']} B > baseline {base['peak_bytes']} B")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated, e.g. 1K,64K,1M,50M")
+    parser.add_argument("--kinds", default=",".join(corpus.KINDS))
+    parser.add_argument("--ops", default="", help="only case labels starting with these (comma-separated)")
+    parser.add_argument("--tolerance", type=float, default=0.30)
+    parser.add_argument("--output", help="also write results JSON here")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [corpus.parse_size(s) for s in args.sizes.split(",")]
+    kinds = args.kinds.split(",")
+    prefixes = tuple(p for p in args.ops.split(",") if p)
+    cases = [c for c in CASES if not prefixes or c[0].startswith(prefixes)]
+    client = make_client()
+
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            text = corpus.generate(kind, size)
+            for label, name, params in cases:
+                for row in measure(label, name, params, kind, size, text, client):
+                    results.append(row)
+                    print(f"{row['key']:<55} {row['mb_per_s']:>10.2f} MB/s {row['peak_bytes'] / MB:>9.2f} MB peak")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as fh:
+                baseline = json.load(fh)
+        baseline.update({row["key"]: {"mb_per_s": row["mb_per_s"], "peak_bytes": row["peak_bytes"]}
+                         for row in results})
+        with open(BASELINE_PATH, "w") as fh:
+            json.dump(dict(sorted(baseline.items())), fh, indent=1)
+            fh.write("\n")
+        print(f"baseline updated: {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("no baseline recorded; run with --update-baseline", file=sys.stderr)
+        return 0
+    with open(BASELINE_PATH) as fh:
+        failures = compare(results, json.load(fh), args.tolerance)
+    for failure in failures:
+        print("REGRESSION", failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Measure textEditorApp cold start against a budget.
+
+Each sample runs in a fresh interpreter so nothing is cached between runs:
+import the app module, build the app, and serve the first request through
+the test client. The DB is pointed at in-memory SQLite and auth is off, so
+any database round-trip or auth setup creeping back into startup shows up
+here as a budget failure. The app is built as in production (not in
+testing mode), and a startup that starts child processes beyond the regex
+workers fails outright.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--budget-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, multiprocessing, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://", "SECRET_KEY": "bench",
+                  "LOGIN_DISABLED": True, "RATELIMIT_ENABLED": False})
+t2 = time.perf_counter()
+resp = app.test_client().get("/")
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+assert len(multiprocessing.active_children()) <= app.config["REGEX_WORKERS"], \
+    "startup started child processes besides the regex workers"
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "total_ms": (t3 - t0) * 1000}))
+"""
+
+
+def sample():
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=APP_DIR,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float,
+                        default=float(os.environ.get("COLD_START_BUDGET_MS", "1500")))
+    args = parser.parse_args()
+
+    samples = [sample() for _ in range(args.runs)]
+    report = {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+    report["budget_ms"] = args.budget_ms
+    print(json.dumps(report, indent=2))
+
+    if report["total_ms"] > args.budget_ms:
+        print(f"cold start {report['total_ms']} ms exceeds budget {args.budget_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Deterministic, locally generated benchmark corpus.
+
+Every kind of document is produced from a fixed seed, so the same size
+always yields the same text and results are comparable across runs and
+machines without shipping fixture files.
+"""
+import random
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog product quality design shipping "
+    "customer experience performance reliable modern simple premium lightweight "
+    "durable service analysis content editor writer student business report "
+    "data value market team strategy system process result growth a an of to in"
+).split()
+
+UNICODE_WORDS = (
+    "naïve café résumé Straße ĳsselmeer Ελληνικά ελπίδα русский текст "
+    "中文字符 日本語の文章 한국어 문장 العربية עברית हिन्दी ไทย "
+    "😀 🚀 👩‍💻 é ä ﬁ ﬂ ℌ ℕ"
+).split()
+
+CODE_LINES = (
+    "def handler(request, *args, **kwargs):",
+    "    data = request.get_json() or {}",
+    "    for i, item in enumerate(data.get('items', [])):",
+    "        if item is None: continue  # skip blanks",
+    "    return {\"status\": \"ok\", \"count\": len(items)}",
+    "class Model(Base):",
+    "    __tablename__ = 'records'",
+    "    id = Column(Integer, primary_key=True)",
+    "# TODO: handle edge cases (see issue #123)",
+    "x = [n ** 2 for n in range(10) if n % 3 == 0]",
+)
+
+LOG_LEVELS = ("INFO", "DEBUG", "WARNING", "ERROR")
+
+KINDS = ("prose", "code", "logs", "unicode", "one_line")
+
+
+def _sentence(rng, vocab):
+    words = [rng.choice(vocab) for _ in range(rng.randint(5, 18))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice((".", ".", ".", "!", "?"))
+
+
+def _prose(rng):
+    sentences = " ".join(_sentence(rng, WORDS) for _ in range(rng.randint(2, 6)))
+    return sentences + "\n\n"
+
+
+def _code(rng):
+    return "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(3, 12))) + "\n\n"
+
+
+def _logs(rng):
+    return (f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+            f"{rng.randint(0, 59):02d}Z {rng.choice(LOG_LEVELS)} worker-{rng.randint(1, 8)} "
+            f"req={rng.getrandbits(32):08x} {_sentence(rng, WORDS)} took={rng.randint(1, 900)}ms\n")
+
+
+def _unicode(rng):
+    return _sentence(rng, UNICODE_WORDS + WORDS) + rng.choice((" ", "\n", "\n\n"))
+
+
+def _one_line(rng):
+    return _sentence(rng, WORDS) + " "
+
+
+GENERATORS = {
+    "prose": _prose,
+    "code": _code,
+    "logs": _logs,
+    "unicode": _unicode,
+    "one_line": _one_line,
+}
+
+
+def generate(kind, size, seed=0):
+    """Return a ``kind`` document of exactly ``size`` characters."""
+    rng = random.Random(f"{kind}:{seed}")
+    make = GENERATORS[kind]
+    parts = []
+    total = 0
+    while total < size:
+        part = make(rng)
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)[:size]
+
+
+def parse_size(value):
+    """``"64K"`` -> 65536, ``"50M"`` -> 52428800, ``"1000"`` -> 1000."""
+    value = value.strip().upper()
+    for suffix, factor in (("K", 1024), ("M", 1024 * 1024)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
@@ -1,4 +1,14 @@
-from app_simple import app
+import logging
+import os
+
+from app import create_app
+from asgi import AsgiBridge
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+
+app = create_app()
+# ASGI entry point: uvicorn main:asgi_app (see asgi.py)
+asgi_app = AsgiBridge(app)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,41 @@
+"""The text API's view body, shared by the blueprint in ``routes`` and the
+standalone app in ``Py_backend``: run one ``text_engine`` operation on the
+request and map its errors to HTTP responses in one place."""
+from flask import current_app, jsonify, request
+
+import regex_sandbox
+import transport
+from regex_sandbox import RegexBudgetError, SandboxBusyError
+from text_engine import OperationError
+
+
+def sandbox_busy():
+    response = jsonify({"error": "Too many regex jobs running, please retry shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+def run_operation(name, label, error_message, paged=False):
+    """Answer the request with operation ``name``; ``label`` names it in the
+    error log and ``error_message`` is the body of a 500."""
+    try:
+        # text/plain or octet-stream bodies skip JSON both ways
+        raw = transport.is_raw_body()
+        data = transport.raw_request_data(name) if raw else request.get_json()
+        if not paged:
+            payload = regex_sandbox.run_operation(name, data)
+            return transport.raw_response(payload) if raw else jsonify(payload)
+        # Later pages name the cached text ("doc") instead of sending it again
+        doc_id = transport.with_document(data)
+        return jsonify(dict(regex_sandbox.run_operation(name, data), doc=doc_id))
+    except transport.DocumentMissingError:
+        return jsonify({"error": "Document expired, send the text again", "missing_document": True}), 404
+    except RegexBudgetError as e:
+        return jsonify({"error": str(e)}), 422
+    except SandboxBusyError:
+        return sandbox_busy()
+    except OperationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in {label}: {str(e)}")
+        return jsonify({"error": error_message}), 500
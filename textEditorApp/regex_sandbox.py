@@ -0,0 +1,401 @@
+"""Run user-supplied regexes in killable worker processes.
+
+A catastrophic-backtracking pattern (``(a+)+$`` on a long run of ``a``)
+can pin a CPU for hours inside a single ``re`` call, which no thread can
+interrupt. Regex find-replace and find-matches therefore run in a small
+pool of worker processes, forked when the app is built (before the server
+starts any threads), one job per worker at a time:
+
+* each job gets ``REGEX_TIMEOUT`` seconds; a worker still busy after that
+  is killed, replaced by a fresh one, and the request fails with
+  ``RegexBudgetError`` (a 422);
+* waiting for a free worker is bounded by the same budget, after which
+  ``SandboxBusyError`` (a 503) tells the client to retry;
+* with ``REGEX_SCREEN`` on, patterns whose repeated part can match the
+  same input in more than one way -- the exponential shapes like
+  ``(a+)+``, ``(\\w+\\s?)*`` or ``(a|aa)+`` -- are refused up front,
+  before any worker is involved. Unambiguous nesting such as
+  ``(\\d+\\.)+\\d+`` passes. The screen only looks a character or so
+  ahead, so some overlapping alternations, e.g. ``(a|ab)*c`` or
+  ``(\\w|\\d)+$``, get through and are left to the time budget.
+
+Everything else in ``text_engine`` runs inline as before. Call
+``init_regex_sandbox(app)`` once; views go through ``run_operation()`` and
+``run_batch()`` instead of the ``text_engine`` functions of the same name.
+"""
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import re
+import signal
+import threading
+
+from flask import current_app
+
+import text_engine
+from text_engine import OperationError
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Operations that run a user pattern when called with use_regex
+REGEX_OPERATIONS = {"find-replace", "find-matches"}
+# Batches with regex steps get REGEX_TIMEOUT per this many input characters
+BATCH_CHARS_PER_BUDGET = 1024 * 1024
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+# Python 3.11+; atomic groups and possessive repeats never backtrack into themselves
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+# The missing "no" branch of (?(1)yes)
+_EMPTY = ()
+_SINGLE_CHARS = (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN)
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: re.compile(r"\d"),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+    sre_constants.CATEGORY_SPACE: re.compile(r"\s"),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+    sre_constants.CATEGORY_WORD: re.compile(r"\w"),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(r"\W"),
+}
+# Character sets are compared on this sample plus every character the
+# pattern names, which is enough to tell whether two of them overlap
+_SAMPLE_CHARS = frozenset(map(chr, range(128))) | frozenset("\u00a0\u00e9\u00c9\u00df\u017f\u0663\u2028\u212a\u4e2d")
+
+
+class RegexBudgetError(OperationError):
+    """The pattern was refused or ran past its time budget."""
+
+
+class SandboxBusyError(Exception):
+    """No regex worker became free within the time budget."""
+
+
+def _serve(conn, parent_end):
+    # Runs in the forked worker: answer (func, args) jobs until the pipe closes
+    parent_end.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        try:
+            func, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, func(*args))
+        except Exception as e:
+            reply = (False, e)
+        conn.send_bytes(_encode(reply))
+
+
+def _encode(reply):
+    """Pickle a worker's ``(ok, value)`` reply. A value that can't make the
+    round trip would kill the worker, and the job would look like a timeout,
+    so it goes back as a plain error string instead."""
+    ok, value = reply
+    try:
+        data = pickle.dumps(reply)
+        if not ok:
+            # Exceptions with custom __init__ arguments pickle but don't load
+            pickle.loads(data)
+        return data
+    except Exception as e:
+        message = f"{type(value).__name__}: {value}" if not ok else f"Unpicklable result: {e}"
+        return pickle.dumps((False, message))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_end = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_end, self.conn), daemon=True)
+        self.process.start()
+        child_end.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RegexSandbox:
+    def __init__(self, workers, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        # fork: workers inherit the loaded modules and start in milliseconds
+        self._context = multiprocessing.get_context("fork")
+        self._idle = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the workers; again after a fork, since pipes don't survive one.
+
+        ``init_regex_sandbox`` calls it while the process is still single
+        threaded, so the first job finds the workers ready. Only a process
+        forked after that (e.g. gunicorn ``--preload``) starts them in
+        ``call()``.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._idle = queue.Queue()
+            for _ in range(self.workers):
+                self._idle.put(_Worker(self._context))
+            self._pid = os.getpid()
+
+    def call(self, func, *args, timeout=None):
+        """Return ``func(*args)`` computed in a worker within ``timeout`` seconds."""
+        self.start()
+        timeout = timeout or self.timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SandboxBusyError() from None
+        try:
+            worker.conn.send((func, args))
+            if not worker.conn.poll(timeout):
+                raise TimeoutError
+            ok, value = pickle.loads(worker.conn.recv_bytes())
+        except (TimeoutError, OSError, EOFError):
+            worker.kill()
+            worker = _Worker(self._context)
+            raise RegexBudgetError(
+                f"The regex took longer than {timeout:g}s on this text; simplify the pattern") from None
+        finally:
+            self._idle.put(worker)
+        if not ok:
+            raise value if isinstance(value, Exception) else RuntimeError(value)
+        return value
+
+
+def init_regex_sandbox(app):
+    app.config.setdefault("REGEX_TIMEOUT", float(os.environ.get("REGEX_TIMEOUT", "2")))
+    app.config.setdefault("REGEX_WORKERS", int(os.environ.get("REGEX_WORKERS", "2")))
+    app.config.setdefault("REGEX_SCREEN", os.environ.get("REGEX_SCREEN", "1") == "1")
+    sandbox = RegexSandbox(app.config["REGEX_WORKERS"], app.config["REGEX_TIMEOUT"])
+    # Forked now, while the app is being built and no server threads exist
+    sandbox.start()
+    app.extensions["regex_sandbox"] = sandbox
+
+
+class _AmbiguityScreen:
+    """Finds repeats whose body can match the same text in more than one way.
+
+    Backtracking is exponential when, inside a repeat, the engine can end
+    one piece of the body and start the next with the same character --
+    ``a+`` followed by another ``a+`` iteration in ``(a+)+``, or two
+    alternatives of ``(a|aa)+`` that both start with ``a``. Every piece
+    that can either stop or go on is checked against the characters that
+    can come next (its "follow" set); alternatives are compared on their
+    leading single characters, then one set for whatever comes after.
+    Character sets are compared on a sample, and only that far ahead, so
+    the screen stays cheap. It can misjudge either way: an
+    overlap that shows only later, as in ``(a|ab)*c``, gets through, and
+    the time budget still covers it.
+    """
+
+    def __init__(self, pattern, parsed):
+        flags = parsed.state.flags
+        self.ignorecase = bool(flags & re.IGNORECASE)
+        self.dotall = bool(flags & re.DOTALL)
+        self.alphabet = _SAMPLE_CHARS | frozenset(pattern) | frozenset(self._named_chars(parsed))
+        self._firsts = {}
+
+    def _named_chars(self, node):
+        if isinstance(node, sre_parse.SubPattern):
+            node = node.data
+        if not isinstance(node, (list, tuple)):
+            return
+        if len(node) == 2 and node[0] in (sre_constants.LITERAL, sre_constants.NOT_LITERAL):
+            yield chr(node[1])
+        elif len(node) == 2 and node[0] is sre_constants.RANGE:
+            yield from map(chr, node[1])
+        else:
+            for child in node:
+                yield from self._named_chars(child)
+
+    def _chars(self, test):
+        chars = {c for c in self.alphabet if test(c)}
+        if self.ignorecase:
+            chars |= {c for c in self.alphabet if c.lower() in chars or c.upper() in chars}
+        return frozenset(chars)
+
+    def _in(self, items):
+        negate = items and items[0][0] is sre_constants.NEGATE
+
+        def test(c):
+            for op, av in items:
+                if op is sre_constants.LITERAL and c == chr(av):
+                    return True
+                if op is sre_constants.RANGE and av[0] <= ord(c) <= av[1]:
+                    return True
+                if op is sre_constants.CATEGORY:
+                    category = _CATEGORIES.get(av)
+                    if category is None or category.match(c):
+                        return True
+            return False
+
+        return self._chars((lambda c: not test(c)) if negate else test)
+
+    def first(self, subpattern):
+        """``(chars a match can start with, whether it can be empty)``."""
+        key = id(subpattern)
+        if key not in self._firsts:
+            self._firsts[key] = self._sequence_first(subpattern)
+        return self._firsts[key]
+
+    def _sequence_first(self, nodes):
+        chars = frozenset()
+        for node in nodes:
+            node_chars, nullable = self._node_first(*node)
+            chars |= node_chars
+            if not nullable:
+                return chars, False
+        return chars, True
+
+    def _node_first(self, op, av):
+        if op is sre_constants.LITERAL:
+            return self._chars(lambda c: c == chr(av)), False
+        if op is sre_constants.NOT_LITERAL:
+            return self._chars(lambda c: c != chr(av)), False
+        if op is sre_constants.ANY:
+            return self._chars(lambda c: self.dotall or c != "\n"), False
+        if op is sre_constants.IN:
+            return self._in(av), False
+        if op is sre_constants.SUBPATTERN:
+            return self.first(av[-1])
+        if op in _REPEATS or op is _POSSESSIVE_REPEAT:
+            chars, nullable = self.first(av[2])
+            return chars, nullable or av[0] == 0
+        if op is _ATOMIC_GROUP:
+            return self.first(av)
+        if op is sre_constants.BRANCH:
+            return self._alternatives_first(av[1])
+        if op is sre_constants.GROUPREF_EXISTS:
+            return self._alternatives_first((av[1], av[2] or _EMPTY))
+        if op is sre_constants.GROUPREF:
+            return self.alphabet, True
+        # Anchors and lookarounds consume nothing
+        return frozenset(), True
+
+    def _alternatives_first(self, alternatives):
+        chars, nullable = frozenset(), False
+        for alternative in alternatives:
+            alt_chars, alt_nullable = self.first(alternative)
+            chars |= alt_chars
+            nullable = nullable or alt_nullable
+        return chars, nullable
+
+    def ambiguous(self, subpattern, follow=frozenset(), looped=False):
+        """True if ``subpattern``, followed by ``follow``, can split some
+        input in two ways while inside a repeat (``looped``)."""
+        nodes = list(subpattern)
+        # follows[i]: what can come after nodes[i]
+        follows = [follow] * len(nodes)
+        after = follow
+        for i in range(len(nodes) - 1, -1, -1):
+            follows[i] = after
+            chars, nullable = self._node_first(*nodes[i])
+            after = chars | after if nullable else chars
+        return any(self._node_ambiguous(op, av, follows[i], looped) for i, (op, av) in enumerate(nodes))
+
+    def _node_ambiguous(self, op, av, follow, looped):
+        if op in _REPEATS:
+            low, high, body = av
+            chars, nullable = self.first(body)
+            repeats = high == sre_constants.MAXREPEAT or high > 1
+            # Can stop here or go on with the same character
+            if looped and high != low and chars & follow:
+                return True
+            if repeats and nullable and high == sre_constants.MAXREPEAT:
+                return True
+            return self.ambiguous(body, chars | follow if repeats else follow, looped or repeats)
+        if op is sre_constants.SUBPATTERN:
+            return self.ambiguous(av[-1], follow, looped)
+        if op is sre_constants.BRANCH or op is sre_constants.GROUPREF_EXISTS:
+            alternatives = av[1] if op is sre_constants.BRANCH else (av[1], av[2] or _EMPTY)
+            if looped:
+                prefixes = [self._prefix(alternative, follow) for alternative in alternatives]
+                for i, prefix in enumerate(prefixes):
+                    for other in prefixes[:i]:
+                        # Overlapping at every position compared: both can match
+                        if all(a & b for a, b in zip(prefix, other)):
+                            return True
+            return any(self.ambiguous(alternative, follow, looped) for alternative in alternatives)
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            return self.ambiguous(av[1])
+        return False
+
+    def _prefix(self, alternative, follow):
+        """Character sets for the leading single characters of ``alternative``,
+        then one set for whatever comes next; two alternatives that differ
+        anywhere in there cannot both match."""
+        nodes = list(self._flatten(alternative))
+        sets = []
+        for i, (op, av) in enumerate(nodes):
+            if op not in _SINGLE_CHARS:
+                chars, nullable = self._sequence_first(nodes[i:])
+                sets.append(chars | follow if nullable else chars)
+                return sets
+            sets.append(self._node_first(op, av)[0])
+        sets.append(follow)
+        return sets
+
+    def _flatten(self, nodes):
+        for op, av in nodes:
+            if op is sre_constants.SUBPATTERN:
+                yield from self._flatten(av[-1])
+            else:
+                yield op, av
+
+
+def screen_pattern(pattern, flags=0):
+    """Refuse patterns that repeat an ambiguous body, e.g. ``(a+)+``."""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        # Reported as an invalid pattern by the operation itself
+        return
+    if _AmbiguityScreen(pattern, parsed).ambiguous(parsed):
+        raise RegexBudgetError(
+            "The regex repeats a part that can match the same text in more than one way, "
+            "like (a+)+ or (a|aa)+, which can take exponential time; make the repeated part unambiguous")
+
+
+def regex_steps(steps):
+    """The steps of a batch that run a user pattern."""
+    return [step for step in steps
+            if isinstance(step, dict) and step.get("operation") in REGEX_OPERATIONS and step.get("use_regex")]
+
+
+def _screen(steps):
+    if not current_app.config["REGEX_SCREEN"]:
+        return
+    for step in steps:
+        find = step.get("find")
+        if isinstance(find, str) and find:
+            screen_pattern(find, 0 if step.get("case_sensitive") else re.IGNORECASE)
+
+
+def run_operation(name, data):
+    """``text_engine.run()``, with regex operations sent to the sandbox."""
+    if name not in REGEX_OPERATIONS or not data.get("use_regex"):
+        return text_engine.run(name, data)
+    _screen([dict(data, operation=name)])
+    return current_app.extensions["regex_sandbox"].call(text_engine.run, name, data)
+
+
+def run_batch(steps, documents, executor=None, chunks=1):
+    """``text_engine.run_batch()``; chains with a regex step run in the sandbox."""
+    pattern_steps = regex_steps(steps) if isinstance(steps, list) else []
+    if not pattern_steps:
+        return text_engine.run_batch(steps, documents, executor, chunks)
+    _screen(pattern_steps)
+    total_chars = sum(len(doc) for doc in documents if isinstance(doc, str))
+    timeout = current_app.config["REGEX_TIMEOUT"] * max(1, math.ceil(total_chars / BATCH_CHARS_PER_BUDGET))
+    return current_app.extensions["regex_sandbox"].call(text_engine.run_batch, steps, documents, timeout=timeout)
@@ -4,7 +4,7 @@ import uuid
 from functools import wraps
 from urllib.parse import urlencode
 
-from flask import g, session, redirect, request, render_template, url_for
+from flask import current_app, g, session, redirect, request, render_template, url_for
 from flask_dance.consumer import (
     OAuth2ConsumerBlueprint,
     oauth_authorized,
@@ -16,10 +16,10 @@ from oauthlib.oauth2.rfc6749.errors import InvalidGrantError
 from sqlalchemy.exc import NoResultFound
 from werkzeug.local import LocalProxy
 
-from app import app, db
+from app import db
 from models import OAuth, User
 
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 
 
 @login_manager.user_loader
@@ -159,6 +159,9 @@ def require_login(f):
 
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        if current_app.config.get("LOGIN_DISABLED"):
+            return f(*args, **kwargs)
+
         if not current_user.is_authenticated:
             session["next_url"] = get_next_navigation_url(request)
             return redirect(url_for('replit_auth.login'))
@@ -14,6 +14,100 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// ---- Request layer ----
+// Every API call goes through apiRequest(). A newer request on the same
+// channel (by default, the same endpoint) aborts the one still in flight,
+// so slow responses never pile up or arrive out of order, and large
+// bodies are gzip-compressed before upload (inflated by transport.py).
+const API_GZIP_THRESHOLD = 32 * 1024;
+// Server default for MAX_DECOMPRESSED_SIZE; larger texts are refused here
+// instead of being uploaded only to be rejected
+const API_MAX_UPLOAD_BYTES = 64 * 1024 * 1024;
+const COUNT_DEBOUNCE_MS = 150;
+const COUNT_DEBOUNCE_MIN_CHARS = 100000;
+const WORDS_PER_MINUTE = 200;
+
+const inflightRequests = new Map();
+
+class RequestTooLargeError extends Error {}
+
+function isAbortError(error) {
+    return error && error.name === 'AbortError';
+}
+
+async function encodeBody(json) {
+    const bytes = new TextEncoder().encode(json);
+    if (bytes.length > API_MAX_UPLOAD_BYTES) {
+        throw new RequestTooLargeError(
+            `Text is too large to process (max ${API_MAX_UPLOAD_BYTES / (1024 * 1024)} MB)`);
+    }
+    if (bytes.length < API_GZIP_THRESHOLD || typeof CompressionStream === 'undefined') {
+        return { body: bytes, headers: {} };
+    }
+    const stream = new Blob([bytes]).stream().pipeThrough(new CompressionStream('gzip'));
+    return { body: await new Response(stream).arrayBuffer(), headers: { 'Content-Encoding': 'gzip' } };
+}
+
+// POST `data` as JSON; resolves with the parsed JSON body (or a Blob for
+// responseType 'blob'), rejects with an AbortError when superseded.
+async function apiRequest(path, data, { channel = path, responseType = 'json' } = {}) {
+    const previous = inflightRequests.get(channel);
+    if (previous) {
+        previous.abort();
+    }
+    const controller = new AbortController();
+    inflightRequests.set(channel, controller);
+    try {
+        const { body, headers } = await encodeBody(JSON.stringify(data));
+        // A newer call may have come in while this body was being compressed
+        if (controller.signal.aborted) {
+            throw new DOMException('Superseded', 'AbortError');
+        }
+        const response = await fetch(path, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', ...headers },
+            body: body,
+            signal: controller.signal
+        });
+        if (responseType === 'blob') {
+            if (!response.ok) {
+                throw new Error(`Request failed with status ${response.status}`);
+            }
+            return await response.blob();
+        }
+        if (!(response.headers.get('Content-Type') || '').includes('json')) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
+        return await response.json();
+    } finally {
+        if (inflightRequests.get(channel) === controller) {
+            inflightRequests.delete(channel);
+        }
+    }
+}
+
+function debounce(func, wait) {
+    let timer = null;
+    return function(...args) {
+        clearTimeout(timer);
+        timer = setTimeout(() => func.apply(this, args), wait);
+    };
+}
+
+function reportRequestError(error, message) {
+    // A superseded request is not a failure; its replacement is on the way
+    if (isAbortError(error)) {
+        return;
+    }
+    console.error('Error:', error);
+    showToast(error instanceof RequestTooLargeError ? error.message : message, 'danger');
+}
+
+// Python's len(): code points, not UTF-16 units
+function countCodePoints(text) {
+    return text.length - (text.match(/[\uD800-\uDBFF][\uDC00-\uDFFF]/g) || []).length;
+}
+
 // Tool Navigation Setup
 function setupToolNavigation() {
     const navLinks = document.querySelectorAll('[data-tool]');
@@ -48,15 +142,21 @@ function setupTextCounters() {
     const caseInput = document.getElementById('case-input');
     if (caseInput) {
         caseInput.addEventListener('input', function() {
-            document.getElementById('case-char-count').textContent = this.value.length;
+            document.getElementById('case-char-count').textContent = countCodePoints(this.value);
         });
     }
     
     // Text counter real-time updates
     const counterInput = document.getElementById('counter-input');
     if (counterInput) {
+        // Counting is local; only very long texts are worth debouncing
+        const countTextDebounced = debounce(countText, COUNT_DEBOUNCE_MS);
         counterInput.addEventListener('input', function() {
-            countText();
+            if (this.value.length > COUNT_DEBOUNCE_MIN_CHARS) {
+                countTextDebounced();
+            } else {
+                countText();
+            }
         });
     }
 }
@@ -76,14 +176,7 @@ function convertCase(caseType) {
         case_type: caseType
     };
     
-    fetch('/api/convert-case', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/convert-case', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
@@ -92,43 +185,34 @@ function convertCase(caseType) {
             showToast('Text converted successfully!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during conversion', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during conversion'));
 }
 
 // Text Counting Function
-function countText() {
-    const input = document.getElementById('counter-input').value;
-    
-    const data = {
-        text: input
+// Same rules as count_text() in text_engine.py, but computed in the browser:
+// typing in the counter never touches the server.
+function countTextLocally(text) {
+    const characters = countCodePoints(text);
+    // str.split() in Python also splits on the \x1c-\x1f separators and NEL
+    const words = (text.match(/[^\s\x1c-\x1f\x85]+/g) || []).length;
+    return {
+        characters: characters,
+        characters_no_spaces: characters - (text.split(' ').length - 1),
+        words: words,
+        sentences: text.split(/[.!?]+/).filter(s => s.trim()).length,
+        paragraphs: text.split('\n\n').filter(p => p.trim()).length,
+        reading_time: Math.ceil(words / WORDS_PER_MINUTE)
     };
-    
-    fetch('/api/count-text', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.error) {
-            console.error(data.error);
-        } else {
-            document.getElementById('stat-characters').textContent = data.characters;
-            document.getElementById('stat-characters-no-spaces').textContent = data.characters_no_spaces;
-            document.getElementById('stat-words').textContent = data.words;
-            document.getElementById('stat-sentences').textContent = data.sentences;
-            document.getElementById('stat-paragraphs').textContent = data.paragraphs;
-            document.getElementById('stat-reading-time').textContent = data.reading_time;
-        }
-    })
-    .catch(error => {
-        console.error('Error:', error);
-    });
+}
+
+function countText() {
+    const data = countTextLocally(document.getElementById('counter-input').value);
+    document.getElementById('stat-characters').textContent = data.characters;
+    document.getElementById('stat-characters-no-spaces').textContent = data.characters_no_spaces;
+    document.getElementById('stat-words').textContent = data.words;
+    document.getElementById('stat-sentences').textContent = data.sentences;
+    document.getElementById('stat-paragraphs').textContent = data.paragraphs;
+    document.getElementById('stat-reading-time').textContent = data.reading_time;
 }
 
 // Find and Replace Function
@@ -159,14 +243,7 @@ function findReplace() {
         use_regex: useRegex
     };
     
-    fetch('/api/find-replace', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/find-replace', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
@@ -177,10 +254,100 @@ function findReplace() {
             showToast('Find and replace completed!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during find and replace', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during find and replace'));
+}
+
+// Find Next: pages of match offsets from /api/find-matches, fetched 100 at
+// a time and only when the previous page has been stepped through, so a
+// huge text is never rewritten or sent back just to locate the next hit.
+// The text is uploaded with the first page only; later pages name the
+// server's cached copy ("doc") and upload again only if it has expired.
+const FIND_PAGE_SIZE = 100;
+let findState = null;
+
+// Server offsets count code points; textarea selections count UTF-16 units.
+// Matches arrive in order, so each conversion walks on from the last one.
+function codePointsToIndex(text, offset, anchor) {
+    let { offset: points, index } = anchor;
+    while (points < offset && index < text.length) {
+        const code = text.charCodeAt(index);
+        index += (code >= 0xD800 && code <= 0xDBFF && index + 1 < text.length) ? 2 : 1;
+        points++;
+    }
+    anchor.offset = points;
+    anchor.index = index;
+    return index;
+}
+
+async function findNext() {
+    const textarea = document.getElementById('fr-input');
+    const input = textarea.value;
+    const query = {
+        find: document.getElementById('find-text').value,
+        case_sensitive: document.getElementById('case-sensitive').checked,
+        use_regex: document.getElementById('use-regex').checked
+    };
+    const status = document.getElementById('replace-status');
+
+    if (!input || !query.find) {
+        showToast('Please enter some text and something to find', 'warning');
+        return;
+    }
+
+    const key = JSON.stringify(query);
+    if (!findState || findState.key !== key || findState.text !== input) {
+        findState = { key, text: input, doc: null, matches: [], position: 0, seen: 0, nextCursor: 0,
+                      anchor: { offset: 0, index: 0 } };
+    }
+    const state = findState;
+
+    try {
+        if (state.position >= state.matches.length) {
+            if (state.nextCursor === null) {
+                // Past the last match: start over from the top
+                findState = null;
+                status.textContent = state.seen ? 'No more matches; searching again from the top' : 'No matches';
+                return;
+            }
+            const page = { ...query, cursor: state.nextCursor, limit: FIND_PAGE_SIZE };
+            let data = await apiRequest('/api/find-matches',
+                state.doc ? { ...page, doc: state.doc } : { ...page, text: input });
+            if (data.missing_document) {
+                data = await apiRequest('/api/find-matches', { ...page, text: input });
+            }
+            if (data.error) {
+                showToast(data.error, 'danger');
+                findState = null;
+                return;
+            }
+            state.doc = data.doc;
+            state.matches = data.matches;
+            state.position = 0;
+            state.nextCursor = data.next_cursor;
+            if (!state.matches.length) {
+                findState = null;
+                status.textContent = state.seen ? 'No more matches' : 'No matches';
+                return;
+            }
+        }
+        // A newer search may have replaced this one while the page loaded
+        if (findState !== state) {
+            return;
+        }
+        const match = state.matches[state.position++];
+        state.seen++;
+        const start = codePointsToIndex(input, match.start, state.anchor);
+        const end = codePointsToIndex(input, match.end, state.anchor);
+        textarea.focus();
+        textarea.setSelectionRange(start, end);
+        const more = state.position < state.matches.length || state.nextCursor !== null;
+        status.textContent = `Match ${state.seen}${more ? '' : ' (last)'}`;
+    } catch (error) {
+        if (!isAbortError(error)) {
+            findState = null;
+        }
+        reportRequestError(error, 'An error occurred while finding matches');
+    }
 }
 
 // Text Cleaning Function
@@ -198,14 +365,7 @@ function cleanText(cleanType) {
         clean_type: cleanType
     };
     
-    fetch('/api/clean-text', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/clean-text', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
@@ -214,10 +374,7 @@ function cleanText(cleanType) {
             showToast('Text cleaned successfully!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during text cleaning', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during text cleaning'));
 }
 
 // Text Formatting Function
@@ -235,14 +392,7 @@ function formatText(formatType) {
         format_type: formatType
     };
     
-    fetch('/api/format-text', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/format-text', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
@@ -251,16 +401,17 @@ function formatText(formatType) {
             showToast('Text formatted successfully!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during text formatting', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during text formatting'));
 }
 
 // SEO Analysis Function
 function analyzeSEO() {
     const input = document.getElementById('seo-input').value;
-    const keyword = document.getElementById('seo-keyword').value;
+    // Several keyphrases may be given, comma-separated; all are answered in one request
+    const keyphrases = document.getElementById('seo-keyword').value
+        .split(',')
+        .map(phrase => phrase.trim())
+        .filter(phrase => phrase);
     const resultsDiv = document.getElementById('seo-results');
     
     if (!input.trim()) {
@@ -270,25 +421,25 @@ function analyzeSEO() {
     
     const data = {
         text: input,
-        keyword: keyword
+        keyword: keyphrases[0] || '',
+        keyphrases: keyphrases
     };
     
-    fetch('/api/seo-analysis', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/seo-analysis', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
         } else {
-            resultsDiv.innerHTML = `
+            const phraseRows = data.keyphrases.map(p => `
                 <div class="stat-item">
-                    <strong>Keyword Density:</strong> ${data.keyword_density}%
-                </div>
+                    <strong>${escapeHtml(p.phrase)}:</strong> ${p.density}% (${p.count}×)
+                </div>`).join('');
+            const topTerms = (data.top_terms['1'] || []).concat(data.top_terms['2'] || [])
+                .slice(0, 10)
+                .map(t => `${escapeHtml(t.term)} (${t.count})`)
+                .join(', ');
+            resultsDiv.innerHTML = `
+                ${phraseRows || `<div class="stat-item"><strong>Keyword Density:</strong> ${data.keyword_density}%</div>`}
                 <div class="stat-item">
                     <strong>Readability Score:</strong> ${data.readability_score}/100
                 </div>
@@ -301,14 +452,14 @@ function analyzeSEO() {
                 <div class="stat-item">
                     <strong>Avg. Syllables per Word:</strong> ${data.avg_syllables_per_word}
                 </div>
+                <div class="stat-item">
+                    <strong>Top Terms:</strong> ${topTerms || '-'}
+                </div>
             `;
             showToast('SEO analysis completed!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during SEO analysis', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during SEO analysis'));
 }
 
 // Text Comparison Function
@@ -327,14 +478,7 @@ function compareTexts() {
         text2: text2
     };
     
-    fetch('/api/compare-text', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    apiRequest('/api/compare-text', data)
     .then(data => {
         if (data.error) {
             showToast(data.error, 'danger');
@@ -366,10 +510,7 @@ function compareTexts() {
             showToast('Text comparison completed!', 'success');
         }
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('An error occurred during text comparison', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'An error occurred during text comparison'));
 }
 
 // Copy to Clipboard Function
@@ -409,19 +550,7 @@ function exportText(elementId, filename) {
         filename: filename
     };
     
-    fetch('/api/export-text', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data)
-    })
-    .then(response => {
-        if (response.ok) {
-            return response.blob();
-        }
-        throw new Error('Export failed');
-    })
+    apiRequest('/api/export-text', data, { responseType: 'blob' })
     .then(blob => {
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
@@ -434,10 +563,14 @@ function exportText(elementId, filename) {
         document.body.removeChild(a);
         showToast('File exported successfully!', 'success');
     })
-    .catch(error => {
-        console.error('Error:', error);
-        showToast('Failed to export file', 'danger');
-    });
+    .catch(error => reportRequestError(error, 'Failed to export file'));
+}
+
+// Escape user text before putting it into innerHTML
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
 }
 
 // Toast Notification Function
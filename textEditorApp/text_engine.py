@@ -0,0 +1,450 @@
+"""Text operations shared by routes.py and Py_backend.py.
+
+Everything here is plain Python over ``str`` -- no Flask -- so it can be
+benchmarked and reused directly. Operations are registered by their API
+name (the ``/api/<name>`` path) together with the request parameters they
+take, which lets the HTTP layers stay thin::
+
+    text_engine.convert_case("hello world", "title")       # pure function
+    text_engine.run("convert-case", {"text": "...", "case_type": "title"})
+    text_engine.run_batch([{"operation": "clean-text", "clean_type": "all"}], docs)
+"""
+import heapq
+import math
+import re
+from collections import Counter, namedtuple
+from operator import itemgetter
+
+# Patterns are compiled once at import instead of on every request.
+SENTENCE_SPLIT_RE = re.compile(r'([.!?]+)')
+SENTENCE_END_RE = re.compile(r'[.!?]+')
+WHITESPACE_RE = re.compile(r'\s+')
+SPECIAL_CHARS_RE = re.compile(r'[^\w\s.!?,:;"-]')
+LIST_MARKER_RE = re.compile(r'^(?:[•·*-]\s*)?(?:\d+\.\s*)?')
+# Whitespace-delimited tokens with no vowel; each still counts as one syllable.
+VOWELLESS_WORD_RE = re.compile(r'(?<!\S)[^\saeiou]+(?!\S)')
+
+# Words for keyphrase matching: punctuation around a word is not part of it
+TOKEN_RE = re.compile(r"\w+(?:['’]\w+)*")
+
+WORDS_PER_MINUTE = 200
+
+# find-matches pages: matches per page, and characters of context each side
+FIND_PAGE_SIZE = 100
+MAX_FIND_PAGE_SIZE = 1000
+FIND_CONTEXT_CHARS = 40
+MAX_FIND_CONTEXT_CHARS = 500
+# Longer matches are cut to this many characters in "text"; start/end stay exact
+MAX_MATCH_PREVIEW = 200
+
+MAX_NGRAM = 3
+MAX_KEYPHRASES = 100
+# Top terms that start or end with one of these are skipped as noise
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in is it its "
+    "of on or our she so that the their them they this to was we were with you your".split()
+)
+
+# (minimum score, label), checked top to bottom
+READABILITY_LEVELS = (
+    (90, "Very Easy"),
+    (80, "Easy"),
+    (70, "Fairly Easy"),
+    (60, "Standard"),
+    (50, "Fairly Difficult"),
+    (30, "Difficult"),
+    (0, "Very Difficult"),
+)
+
+
+class OperationError(ValueError):
+    """Bad input for an operation. The message is safe to return to clients."""
+
+
+Operation = namedtuple("Operation", "name func text_key params")
+
+OPERATIONS = {}
+# Operations that produce a rewritten text ("result") that can feed another operation.
+TEXT_OPERATIONS = {"convert-case", "clean-text", "format-text", "find-replace"}
+
+
+def operation(name, text_key="text", **params):
+    """Register ``func(text, **params)`` under ``name``.
+
+    ``params`` maps each request field the operation reads to its default.
+    """
+    def decorator(func):
+        OPERATIONS[name] = Operation(name, func, text_key, params)
+        return func
+    return decorator
+
+
+def get_operation(name):
+    try:
+        return OPERATIONS[name]
+    except KeyError:
+        raise OperationError(f"Unknown operation: {name}") from None
+
+
+def _as_payload(result):
+    return result if isinstance(result, dict) else {"result": result}
+
+
+def run(name, data):
+    """Run operation ``name`` on a request-style dict and return a JSON-able dict."""
+    op = get_operation(name)
+    params = {key: data.get(key, default) for key, default in op.params.items()}
+    return _as_payload(op.func(data.get(op.text_key, ""), **params))
+
+
+def compile_chain(steps):
+    """Validate a list of ``{"operation": name, **params}`` steps.
+
+    Returns ``[(op, params)]`` ready for apply_chain(). Every step but the
+    last must produce text, since its output feeds the next step.
+    """
+    if not steps:
+        raise OperationError("At least one operation is required")
+    chain = []
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise OperationError("Each operation must be an object")
+        op = get_operation(step.get("operation"))
+        if i < len(steps) - 1 and op.name not in TEXT_OPERATIONS:
+            raise OperationError(f"{op.name} does not return text, so it can only be the last operation")
+        params = {key: step.get(key, default) for key, default in op.params.items()}
+        chain.append((op, params))
+    return chain
+
+
+def apply_chain(chain, text):
+    payload = {"result": text}
+    for op, params in chain:
+        payload = _as_payload(op.func(payload["result"], **params))
+    return payload
+
+
+def _apply_chain_safe(chain, text):
+    if not isinstance(text, str):
+        return {"error": "Document must be a string"}
+    try:
+        return apply_chain(chain, text)
+    except OperationError as e:
+        return {"error": str(e)}
+    except Exception:
+        return {"error": "An error occurred while processing this document"}
+
+
+def _run_chunk(steps, documents):
+    chain = compile_chain(steps)
+    return [_apply_chain_safe(chain, doc) for doc in documents]
+
+
+def run_batch(steps, documents, executor=None, chunks=1):
+    """Run an operation chain over many documents, in order.
+
+    Each item of the returned list is the operation's payload or
+    ``{"error": message}``; one bad document never fails the batch. With
+    an ``executor`` (normally a process pool) the documents are split into
+    ``chunks`` contiguous slices so each worker gets one round-trip.
+    """
+    chain = compile_chain(steps)
+    if executor is None or chunks <= 1 or len(documents) < 2:
+        return [_apply_chain_safe(chain, doc) for doc in documents]
+
+    size = -(-len(documents) // chunks)
+    slices = [documents[i:i + size] for i in range(0, len(documents), size)]
+    results = []
+    for part in executor.map(_run_chunk, [steps] * len(slices), slices):
+        results.extend(part)
+    return results
+
+
+@operation("convert-case", case_type="")
+def convert_case(text, case_type):
+    if case_type == "uppercase":
+        return text.upper()
+    if case_type == "lowercase":
+        return text.lower()
+    if case_type == "title":
+        return text.title()
+    if case_type == "sentence":
+        parts = SENTENCE_SPLIT_RE.split(text.lower())
+        # Even indices are sentence bodies, odd ones the punctuation between them
+        for i in range(0, len(parts), 2):
+            sentence = parts[i].strip()
+            if sentence:
+                parts[i] = sentence[0].upper() + sentence[1:]
+        return "".join(parts)
+    raise OperationError("Invalid case type")
+
+
+@operation("count-text")
+def count_text(text):
+    """Count words, characters, and calculate reading time"""
+    word_count = len(text.split())
+    sentence_count = sum(1 for s in SENTENCE_END_RE.split(text) if s.strip())
+    paragraph_count = sum(1 for p in text.split('\n\n') if p.strip())
+    return {
+        "characters": len(text),
+        "characters_no_spaces": len(text) - text.count(" "),
+        "words": word_count,
+        "sentences": sentence_count,
+        "paragraphs": paragraph_count,
+        "reading_time": math.ceil(word_count / WORDS_PER_MINUTE),
+    }
+
+
+@operation("find-replace", find="", replace="", case_sensitive=False, use_regex=False)
+def find_replace(text, find, replace="", case_sensitive=False, use_regex=False):
+    """Find and replace text; returns the new text and the number of matches."""
+    if not find:
+        raise OperationError("Find text cannot be empty")
+
+    if use_regex:
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            pattern = re.compile(find, flags)
+            result, match_count = pattern.subn(replace, text)
+        except re.error as e:
+            raise OperationError(f"Invalid regex pattern: {str(e)}") from None
+    elif case_sensitive:
+        match_count = text.count(find)
+        result = text.replace(find, replace) if match_count else text
+    else:
+        pattern = re.compile(re.escape(find), re.IGNORECASE)
+        # Plain-text mode: the replacement is literal, not a regex template
+        result, match_count = pattern.subn(lambda _m: replace, text)
+
+    return {"result": result, "replacements": match_count}
+
+
+def _int_param(value, name, low, high):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise OperationError(f"{name} must be a number") from None
+    if not low <= value <= high:
+        raise OperationError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def _iter_match_spans(text, find, case_sensitive, use_regex, pos):
+    """Yield ``(start, end)`` of the matches find_replace() would replace, from ``pos`` on."""
+    if use_regex or not case_sensitive:
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            pattern = re.compile(find if use_regex else re.escape(find), flags)
+        except re.error as e:
+            raise OperationError(f"Invalid regex pattern: {str(e)}") from None
+        # pos= rather than slicing, so ^, \b and lookbehinds see the text before it
+        for match in pattern.finditer(text, pos):
+            yield match.span()
+        return
+    start = text.find(find, pos)
+    while start != -1:
+        yield start, start + len(find)
+        start = text.find(find, start + len(find))
+
+
+@operation("find-matches", find="", case_sensitive=False, use_regex=False,
+           cursor=0, limit=FIND_PAGE_SIZE, context=FIND_CONTEXT_CHARS)
+def find_matches(text, find, case_sensitive=False, use_regex=False,
+                 cursor=0, limit=FIND_PAGE_SIZE, context=FIND_CONTEXT_CHARS):
+    """One page of match positions with surrounding context; the text is not rewritten.
+
+    Offsets are code-point indices into ``text``. Scanning starts at
+    ``cursor`` and stops as soon as the page is full, so a page costs the
+    distance to its last match rather than the whole text. Pass
+    ``next_cursor`` back for the following page; ``None`` means there are
+    no more matches. There is deliberately no total: that needs a full scan.
+    """
+    if not find:
+        raise OperationError("Find text cannot be empty")
+    cursor = _int_param(cursor, "cursor", 0, len(text))
+    limit = _int_param(limit, "limit", 1, MAX_FIND_PAGE_SIZE)
+    context = _int_param(context, "context", 0, MAX_FIND_CONTEXT_CHARS)
+
+    matches = []
+    next_cursor = None
+    # One match past the page tells whether there is another page, and
+    # where it starts: scanning again from there finds that same match first
+    for start, end in _iter_match_spans(text, find, case_sensitive, use_regex, cursor):
+        if len(matches) == limit:
+            next_cursor = start
+            break
+        matches.append({
+            "start": start,
+            "end": end,
+            "text": text[start:min(end, start + MAX_MATCH_PREVIEW)],
+            "before": text[max(0, start - context):start],
+            "after": text[end:end + context],
+        })
+    return {"matches": matches, "cursor": cursor, "next_cursor": next_cursor}
+
+
+@operation("clean-text", clean_type="")
+def clean_text(text, clean_type):
+    """Clean text by removing extra spaces, line breaks, etc."""
+    if clean_type in ("extra_spaces", "line_breaks"):
+        # \s already covers \n and \r, so both collapse to single spaces
+        return WHITESPACE_RE.sub(' ', text).strip()
+    if clean_type == "special_chars":
+        return SPECIAL_CHARS_RE.sub('', text)
+    if clean_type == "all":
+        return WHITESPACE_RE.sub(' ', SPECIAL_CHARS_RE.sub('', text)).strip()
+    raise OperationError("Invalid clean type")
+
+
+@operation("format-text", format_type="")
+def format_text(text, format_type):
+    """Format text as bullet points or numbered lists"""
+    lines = [line.strip() for line in text.split('\n')]
+    lines = [line for line in lines if line]
+
+    if format_type == "bullets":
+        return '\n'.join(f"• {line}" for line in lines)
+    if format_type == "numbers":
+        return '\n'.join(f"{i}. {line}" for i, line in enumerate(lines, start=1))
+    if format_type == "remove_formatting":
+        stripped = (LIST_MARKER_RE.sub('', line, count=1) for line in lines)
+        return '\n'.join(line for line in stripped if line)
+    raise OperationError("Invalid format type")
+
+
+def readability_level(score):
+    for minimum, label in READABILITY_LEVELS:
+        if score >= minimum:
+            return label
+    return READABILITY_LEVELS[-1][1]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class NgramIndex:
+    """Counts of every 1..max_n-word phrase in a token list.
+
+    Each order is counted in a single C-level pass (Counter over zipped
+    token slices), after which any number of phrase lookups are O(1).
+    """
+
+    def __init__(self, tokens, max_n=MAX_NGRAM):
+        self.tokens = tokens
+        self.total = len(tokens)
+        self.max_n = max_n
+        self.counts = {1: Counter(tokens)}
+        for n in range(2, max_n + 1):
+            self.counts[n] = Counter(zip(*(tokens[i:] for i in range(n))))
+
+    def count(self, phrase_tokens):
+        n = len(phrase_tokens)
+        if n == 0:
+            return 0
+        if n == 1:
+            return self.counts[1][phrase_tokens[0]]
+        if n <= self.max_n:
+            return self.counts[n][tuple(phrase_tokens)]
+        # Longer than the index: scan for it
+        first, tokens = phrase_tokens[0], self.tokens
+        return sum(1 for i in range(self.total - n + 1)
+                   if tokens[i] == first and tokens[i:i + n] == phrase_tokens)
+
+    def density(self, phrase_tokens):
+        """Percent of all words that belong to occurrences of the phrase."""
+        if not self.total:
+            return 0
+        return round(self.count(phrase_tokens) * len(phrase_tokens) / self.total * 100, 2)
+
+    def top(self, n, k):
+        """The ``k`` most frequent ``n``-word phrases, skipping stopword edges."""
+        def useful(item):
+            gram = item[0]
+            if n == 1:
+                return gram not in STOPWORDS
+            return gram[0] not in STOPWORDS and gram[-1] not in STOPWORDS
+
+        best = heapq.nlargest(k, filter(useful, self.counts[n].items()), key=itemgetter(1))
+        return [{"term": gram if n == 1 else " ".join(gram), "count": count} for gram, count in best]
+
+
+@operation("seo-analysis", keyword="", keyphrases=(), top_k=10)
+def seo_analysis(text, keyword="", keyphrases=(), top_k=10):
+    """Keyphrase densities, top terms and a simplified Flesch reading-ease score.
+
+    ``keyphrases`` may hold up to MAX_KEYPHRASES phrases; all of them are
+    answered from one n-gram index instead of one scan per phrase.
+    """
+    if not text.strip():
+        raise OperationError("Text cannot be empty")
+    if not isinstance(keyphrases, (list, tuple)) or not all(isinstance(p, str) for p in keyphrases):
+        raise OperationError("keyphrases must be a list of strings")
+    if len(keyphrases) > MAX_KEYPHRASES:
+        raise OperationError(f"At most {MAX_KEYPHRASES} keyphrases per request")
+    try:
+        top_k = max(0, min(int(top_k), 100))
+    except (TypeError, ValueError):
+        raise OperationError("top_k must be a number") from None
+
+    lowered = text.lower()
+    words = lowered.split()
+    word_count = len(words)
+
+    index = NgramIndex(TOKEN_RE.findall(lowered))
+    keyword_density = index.density(tokenize(keyword)) if keyword else 0
+    phrase_stats = []
+    for phrase in keyphrases:
+        phrase_tokens = tokenize(phrase)
+        phrase_stats.append({
+            "phrase": phrase,
+            "count": index.count(phrase_tokens),
+            "density": index.density(phrase_tokens),
+        })
+    top_terms = {str(n): index.top(n, top_k) for n in range(1, MAX_NGRAM + 1)} if top_k else {}
+
+    sentences = max(len(SENTENCE_END_RE.split(text)), 1)
+    avg_sentence_length = word_count / sentences
+
+    # Rough syllables: vowels per word, at least one per word
+    vowels = sum(lowered.count(v) for v in "aeiou")
+    syllables = vowels + len(VOWELLESS_WORD_RE.findall(lowered))
+    avg_syllables_per_word = syllables / max(word_count, 1)
+
+    score = 206.835 - (1.015 * avg_sentence_length) - (84.6 * avg_syllables_per_word)
+    score = max(0, min(100, score))
+
+    return {
+        "keyword_density": keyword_density,
+        "keyphrases": phrase_stats,
+        "top_terms": top_terms,
+        "readability_score": round(score, 1),
+        "readability_level": readability_level(score),
+        "avg_sentence_length": round(avg_sentence_length, 1),
+        "avg_syllables_per_word": round(avg_syllables_per_word, 1),
+    }
+
+
+@operation("compare-text", text_key="text1", text2="")
+def compare_text(text1, text2):
+    """Length differences and word-overlap (Jaccard) similarity."""
+    words1 = text1.split()
+    words2 = text2.split()
+
+    set1 = {word.lower() for word in words1}
+    set2 = {word.lower() for word in words2}
+
+    if not set1 and not set2:
+        similarity = 100
+    elif not set1 or not set2:
+        similarity = 0
+    else:
+        similarity = round((len(set1 & set2) / len(set1 | set2)) * 100, 1)
+
+    return {
+        "char_difference": len(text2) - len(text1),
+        "word_difference": len(words2) - len(words1),
+        "similarity_percentage": similarity,
+        "text1_stats": {"characters": len(text1), "words": len(words1)},
+        "text2_stats": {"characters": len(text2), "words": len(words2)},
+    }
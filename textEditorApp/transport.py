@@ -0,0 +1,263 @@
+"""HTTP transport helpers: response compression, gzip/deflate request
+bodies, input-hash ETags, raw-body requests for the text API and cached
+documents for paged operations."""
+import gzip
+import hashlib
+import io
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from text_engine import OperationError, get_operation
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html", "text/css", "text/javascript", "application/javascript"}
+CONTENT_CODINGS = ("gzip", "deflate")
+RAW_MIMETYPES = {"text/plain", "application/octet-stream"}
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def init_compression(app):
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+    app.config.setdefault("MAX_DECOMPRESSED_SIZE", app.config.get("MAX_CONTENT_LENGTH") or 64 * 1024 * 1024)
+    app.after_request(compress_response)
+    app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app, app.config["MAX_DECOMPRESSED_SIZE"])
+
+
+def compress_response(response):
+    """Gzip/deflate the body if the client accepts it and it is worth it."""
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    # send_file() responses are passthrough file wrappers; anything else
+    # that streams is left alone
+    if response.direct_passthrough:
+        if response.content_length is None:
+            return response
+    elif response.is_streamed:
+        return response
+
+    min_size = current_app.config["COMPRESS_MIN_SIZE"]
+    if response.content_length is not None and response.content_length < min_size:
+        return response
+
+    coding = request.accept_encodings.best_match(CONTENT_CODINGS)
+    if coding is None:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    level = current_app.config["COMPRESS_LEVEL"]
+    if coding == "gzip":
+        body = gzip.compress(data, compresslevel=level, mtime=0)
+    else:
+        body = zlib.compress(data, level)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = coding
+
+    # A strong validator must change with the representation
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{coding}")
+    return response
+
+
+class DecompressRequestMiddleware:
+    """Inflate ``Content-Encoding: gzip|deflate`` request bodies before Flask
+    sees them, refusing anything that inflates past ``max_size`` bytes."""
+
+    def __init__(self, wsgi_app, max_size=None):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        coding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if coding not in CONTENT_CODINGS:
+            return self.wsgi_app(environ, start_response)
+
+        wbits = 16 + zlib.MAX_WBITS if coding == "gzip" else zlib.MAX_WBITS
+        inflater = zlib.decompressobj(wbits)
+        limit = self.max_size or 0
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            body = inflater.decompress(environ["wsgi.input"].read(length), limit)
+            if limit and (inflater.unconsumed_tail or len(body) > limit):
+                return _plain_error(start_response, "413 Request Entity Too Large", b"Decompressed body too large")
+        except (ValueError, zlib.error):
+            return _plain_error(start_response, "400 Bad Request", b"Malformed compressed body")
+
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        del environ["HTTP_CONTENT_ENCODING"]
+        return self.wsgi_app(environ, start_response)
+
+
+def _plain_error(start_response, status, message):
+    start_response(status, [("Content-Type", "text/plain"), ("Content-Length", str(len(message)))])
+    return [message]
+
+
+def input_etag():
+    """Strong ETag for this request's operation and input.
+
+    The text operations are deterministic, so identical path, query, body
+    and body type always produce an identical response. The type is part
+    of it because it picks the representation: the same bytes sent as JSON
+    and as ``text/plain`` get different responses.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(request.path.encode())
+    digest.update(b"?" + request.query_string + b"\0")
+    digest.update(request.mimetype.encode() + b"\0")
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def conditional_on_input(f):
+    """Answer ``If-None-Match`` with 304 before running the operation."""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        etag = input_etag()
+        for candidate in (etag, *(f"{etag}-{coding}" for coding in CONTENT_CODINGS)):
+            if candidate in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(candidate)
+                return response
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+
+    return decorated_function
+
+
+def is_raw_body():
+    """True when the client sent the text itself as the body, not JSON."""
+    return request.mimetype in RAW_MIMETYPES
+
+
+def raw_body_text():
+    try:
+        return request.get_data(cache=True).decode("utf-8")
+    except UnicodeDecodeError:
+        raise OperationError("Request body must be UTF-8 text") from None
+
+
+def raw_request_data(name):
+    """Build the request dict for operation ``name`` from a raw body plus
+    query-string parameters, so no JSON is parsed."""
+    op = get_operation(name)
+    data = {}
+    for key, default in op.params.items():
+        if key in request.args:
+            value = request.args[key]
+            if isinstance(default, bool):
+                value = value.lower() in TRUE_VALUES
+            elif isinstance(default, (list, tuple)):
+                value = request.args.getlist(key)
+            data[key] = value
+    data[op.text_key] = raw_body_text()
+    return data
+
+
+def raw_response(payload):
+    """Send ``payload["result"]`` as the body and every other field as an
+    ``X-`` header. Payloads with no text result are small, so they stay JSON."""
+    if "result" not in payload:
+        return current_app.json.response(payload)
+    response = current_app.response_class(payload["result"], mimetype="text/plain")
+    for key, value in payload.items():
+        if key != "result":
+            response.headers["X-" + key.replace("_", "-").title()] = str(value)
+    return response
+
+
+class DocumentMissingError(Exception):
+    """The request named a document this process no longer holds."""
+
+
+class DocumentCache:
+    """Recently uploaded texts by content hash, so a paged operation can
+    name its document instead of uploading it again for every page.
+
+    Per process and bounded by total characters, least recently used out
+    first. A miss is normal -- eviction, a restart, another worker -- and
+    the client answers it by sending the text once more.
+    """
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self._texts = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def put(self, text):
+        doc_id = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+        if len(text) > self.max_chars:
+            return doc_id
+        with self._lock:
+            if doc_id in self._texts:
+                self._texts.move_to_end(doc_id)
+                return doc_id
+            self._texts[doc_id] = text
+            self._chars += len(text)
+            while self._chars > self.max_chars:
+                _, evicted = self._texts.popitem(last=False)
+                self._chars -= len(evicted)
+        return doc_id
+
+    def get(self, doc_id):
+        with self._lock:
+            text = self._texts.get(doc_id)
+            if text is not None:
+                self._texts.move_to_end(doc_id)
+            return text
+
+
+def _document_cache():
+    cache = current_app.extensions.get("documents")
+    if cache is None:
+        max_chars = current_app.config.get(
+            "DOCUMENT_CACHE_CHARS", int(os.environ.get("DOCUMENT_CACHE_CHARS", str(32 * 1024 * 1024))))
+        cache = current_app.extensions.setdefault("documents", DocumentCache(max_chars))
+    return cache
+
+
+def request_document_id():
+    """The ``doc`` a paged request names instead of sending its text, if any."""
+    if is_raw_body():
+        return request.args.get("doc") or None
+    data = request.get_json(silent=True)
+    doc_id = data.get("doc") if isinstance(data, dict) else None
+    return doc_id if isinstance(doc_id, str) and doc_id else None
+
+
+def with_document(data, text_key="text"):
+    """Resolve a paged request's text and return its document id.
+
+    A request carrying the text has it cached; one carrying only ``doc``
+    gets the cached text filled in, or DocumentMissingError.
+    """
+    text = data.get(text_key)
+    if isinstance(text, str) and text:
+        return _document_cache().put(text)
+    doc_id = request_document_id()
+    if doc_id is None:
+        return None
+    text = _document_cache().get(doc_id)
+    if text is None:
+        raise DocumentMissingError()
+    data[text_key] = text
+    return doc_id